@@ -15,6 +15,86 @@ class Settings(BaseSettings):
 	# AI / Gemini
 	gemini_api_key: str | None = None
 
+	# Embeddings
+	embedding_provider: str = "gemini" # gemini, hashing (offline, deterministic) or onnx (local CPU model)
+	embedding_model: str = "models/text-embedding-004" # Gemini model name
+	embedding_dimensions: int = 768 # Output size of the hashing provider; must match the vector columns
+	onnx_model_path: str = ""
+	onnx_tokenizer_path: str = ""
+
+	# RAG retrieval
+	rag_top_k: int = 5 # Number of material chunks sent as context
+	rag_rrf_k: int = 60 # Reciprocal rank fusion constant
+	lexical_only_max_terms: int = 4 # Short keyword questions skip the embedding call
+	definition_match_count: int = 5 # General definitions added to the context
+	definition_match_threshold: float = 0.5 # Minimum cosine similarity for a definition
+	rag_context_token_budget: int = 2000 # Estimated token cap for material + definition context in the prompt
+	lexical_index_ttl_seconds: float = 300 # BM25 indexes are rebuilt after this to pick up ingestion on other workers
+
+	# Query embeddings
+	query_embedding_cache_size: int = 4096
+	query_embedding_batch_window_ms: float = 5.0 # Concurrent misses within this window share one call
+	query_embedding_max_batch_size: int = 100
+
+	# AI chat answer cache
+	answer_cache_ttl_seconds: int = 600
+	answer_cache_max_entries_per_class: int = 256
+	answer_cache_similarity_threshold: float = 0.95 # Cosine similarity for semantic hits
+
+	# AI admission control (per API process)
+	ai_max_concurrent_calls: int = 8 # Concurrent upstream Gemini calls
+	ai_max_queue_size: int = 64
+	ai_max_queue_wait_seconds: float = 30.0
+	ai_user_rate_per_minute: float = 10
+	ai_user_burst: int = 5
+	ai_class_rate_per_minute: float = 120
+	ai_class_burst: int = 30
+
+	# Batch quiz generation
+	quiz_batch_concurrency: int = 3 # Materials generated concurrently per batch job
+
+	# Material ingestion (process_material_for_rag) admission
+	ingestion_max_concurrency: int = 2 # Ingestion runs executing at once; the rest wait in a queue
+	ingestion_memory_budget_mb: int = 1024 # Total estimated memory of concurrent runs
+	ingestion_base_job_mb: int = 50 # Fixed overhead per run (parsers, embeddings)
+	ingestion_default_job_mb: int = 200 # Estimate when the file size is unknown (e.g. reprocessing)
+
+	# OCR page preprocessing
+	ocr_dpi: int = 150 # Render resolution for scanned PDF pages
+	ocr_color_mode: str = "grayscale" # color, grayscale or binary
+	ocr_crop_margins: bool = True
+	ocr_max_dimension: int = 2000 # Longest page side sent to OCR, in pixels (0 = no limit)
+	ocr_image_format: str = "jpeg" # jpeg, webp or png
+	ocr_image_quality: int = 80
+
+	# OCR page cache
+	ocr_cache_hash_mode: str = "exact" # exact (pixel sha256) or perceptual (dHash, tolerates rescans)
+	ocr_cache_memory_entries: int = 512
+	ocr_cache_ttl_days: int = 90 # Durable entries unused for this long are evicted
+
+	# Bulk definition import
+	definition_import_batch_size: int = 100 # Texts per embedding call (API maximum is 100)
+	definition_import_concurrency: int = 4 # Embedding calls in flight per import
+	definition_import_page_size: int = 500 # Rows per insert request
+	definition_import_max_rows: int = 10000
+
+	# Re-embedding (model migrations)
+	reembedding_provider: str = "gemini" # Target provider written to embedding_next
+	reembedding_model: str = "models/text-embedding-004" # Target model (Gemini model name or ONNX model path)
+	reembedding_batch_size: int = 100
+	reembedding_batches_per_minute: float = 60 # Embedding calls per minute
+
+	# Quiz definition cache (exam hot path)
+	quiz_cache_max_entries: int = 256
+	quiz_cache_ttl_seconds: float = 60 # Bounds staleness from edits made on other workers
+
+	# Quiz checkpoint write-behind buffer (per process: run the backend with a single worker)
+	checkpoint_flush_interval_seconds: float = 2
+	checkpoint_flush_max_pending: int = 1000 # Flush early once this many answers are buffered
+	checkpoint_flush_page_size: int = 500 # Rows per upsert request
+	checkpoint_flush_max_backoff_seconds: float = 60 # Longest wait between retries after failed flushes
+	checkpoint_buffer_max_rows: int = 20000 # New checkpoints get 503 while this many answers are buffered
+
 	# App
 	environment: str = "development"
 
@@ -2,6 +2,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from supabase import create_client, Client
 from .config import settings
+from .services.quiz_cache import quiz_definition_cache
 import jwt
 from uuid import UUID
 from typing import Optional
@@ -97,10 +98,10 @@ def verify_class_membership(
     target_class_id = class_id
     if quiz_id:
         # If quiz_id is provided, fetch class_id from the quiz
-        quiz_res = sb_admin.table("quizzes").select("class_id").eq("id", str(quiz_id)).single().execute()
-        if not quiz_res.data:
+        definition = quiz_definition_cache.get(sb_admin, quiz_id)
+        if definition is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quiz not found.")
-        target_class_id = quiz_res.data['class_id']
+        target_class_id = definition.class_id
 
     if not target_class_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Class not found for the given quiz.")
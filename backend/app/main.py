@@ -1,11 +1,21 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routers import api_router
+from .services.checkpoint_buffer import checkpoint_buffer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	yield
+	# Write out buffered quiz checkpoints before the worker exits
+	await checkpoint_buffer.flush()
 
 
 def create_app() -> FastAPI:
-	app = FastAPI(title="RAG Learning Platform API", version="0.1.0")
+	app = FastAPI(title="RAG Learning Platform API", version="0.1.0", lifespan=lifespan)
 
 	app.add_middleware(
 		CORSMiddleware,
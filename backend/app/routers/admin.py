@@ -8,6 +8,8 @@ import random
 import string
 
 from ..dependencies import get_current_admin_user, get_supabase_admin
+from ..config import settings
+from ..services.reembedding import reembedding_service
 
 router = APIRouter(
     dependencies=[Depends(get_current_admin_user)]
@@ -270,4 +272,54 @@ def delete_class(class_id: UUID, sb: Client = Depends(get_supabase_admin)):
     try:
         sb.table("classes").delete().eq("id", str(class_id)).execute()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Embedding model migration ---
+
+class ReembeddingStart(BaseModel):
+    provider: str | None = None # Defaults to settings.reembedding_provider
+    model: str | None = None # Defaults to settings.reembedding_model
+
+@router.post("/reembedding", status_code=status.HTTP_202_ACCEPTED, summary="Start or resume re-embedding into embedding_next")
+async def start_reembedding(payload: ReembeddingStart, sb: Client = Depends(get_supabase_admin)):
+    """Re-embeds material chunks and definitions with the target model. Resumes from the last checkpoint of the same model."""
+    try:
+        run = reembedding_service.start(
+            sb,
+            provider=payload.provider or settings.reembedding_provider,
+            model=payload.model or settings.reembedding_model,
+            batch_size=settings.reembedding_batch_size,
+            batches_per_minute=settings.reembedding_batches_per_minute,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return run.to_dict()
+
+@router.get("/reembedding", summary="Progress, throughput and ETA of the current re-embedding run")
+def get_reembedding_status():
+    run_status = reembedding_service.status()
+    if run_status is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No re-embedding run since the server started.")
+    return run_status
+
+@router.post("/reembedding/switch", summary="Atomically switch search to the re-embedded vectors")
+def switch_reembedding(payload: ReembeddingStart, sb: Client = Depends(get_supabase_admin)):
+    """Swaps embedding_next into embedding for both tables in one transaction and moves this process to the new model.
+
+    Fails if any row is not re-embedded yet, or if embedding_next was written by another model.
+    """
+    try:
+        reembedding_service.switch(
+            sb,
+            provider=payload.provider or settings.reembedding_provider,
+            model=payload.model or settings.reembedding_model,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"message": "Search now uses the re-embedded vectors. Set EMBEDDING_PROVIDER and EMBEDDING_MODEL to the new model for other workers and restarts."}
@@ -1,9 +1,28 @@
+import asyncio
 import httpx # New import for making HTTP requests
-from fastapi import APIRouter, Depends, HTTPException, status # Added this line
+from contextlib import aclosing
+from uuid import UUID
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status # Added this line
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from backend.app.dependencies import get_current_user, get_raw_token # Modified import
-from backend.app.schemas import QuizGenerationRequest, QuizGenerationResponse
+from supabase import Client
+from backend.app.dependencies import get_current_user, get_current_admin_user, get_current_teacher_user, get_raw_token, get_supabase_admin, verify_class_membership # Modified import
+from backend.app.schemas import QuizGenerationRequest, QuizGenerationResponse, QuizBatchGenerationRequest, QuizBatchJobResponse
 from backend.app.services.rag import rag_service
+from backend.app.services.answer_cache import answer_cache
+from backend.app.services.lexical_index import lexical_index
+from backend.app.services.embeddings import embedding_service
+from backend.app.services.context_packer import context_packer
+from backend.app.services.extraction_cache import extraction_cache
+from backend.app.services.ocr_cache import ocr_page_cache
+from backend.app.services.ingestion_admission import ingestion_admission
+from backend.app.services.quiz_cache import quiz_definition_cache
+from backend.app.services.checkpoint_buffer import checkpoint_buffer
+from backend.app.services.quiz_generation import quiz_generation_service
+from backend.app.services.admission import ai_admission, AdmissionRejected, priority_for_user
+from backend.app.services.jobs import Job, job_registry
+from backend.app.services.sse import format_sse
+from .quizzes import QuestionIn, QuizIn, insert_quiz
 from ..config import settings # New import for settings
 
 router = APIRouter()
@@ -11,36 +30,47 @@ router = APIRouter()
 # New Pydantic model for AI chat request
 class AIChatRequest(BaseModel):
     question: str
+    stream: bool = False # Respond with Server-Sent Events, token by token
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=e.reason,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+def _check_admission(user: dict, class_id: str):
+    """Applies per-user and per-class AI rate limits, failing fast with 429."""
+    try:
+        ai_admission.check(user.get("id"), class_id)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
 
 @router.post("/generate-quiz", response_model=QuizGenerationResponse)
 async def generate_quiz_endpoint(
     request: QuizGenerationRequest,
     current_user: str = Depends(get_raw_token), # Changed to get_raw_token
+    current_teacher: dict = Depends(get_current_teacher_user), # Results are shared between coalesced requests
+    sb_admin: Client = Depends(get_supabase_admin),
 ):
+    material_res = sb_admin.table("materials").select("class_id, content_version").eq("id", request.material_id).execute()
+    if not material_res.data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material not found.")
+    material = material_res.data[0]
+    class_id = str(material["class_id"])
+    # The material is read with the admin client, so enforce class membership before any cached quiz is returned
+    verify_class_membership(class_id=UUID(class_id), user=current_teacher, sb_admin=sb_admin)
+    _check_admission(current_teacher, class_id)
+
     try:
-        # Construct the URL for the Supabase Edge Function
-        edge_function_url = f"{settings.supabase_url}/functions/v1/generate-quiz"
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {current_user}" # current_user is now the raw JWT token
-        }
-        payload = {
-            "material_id": request.material_id,
-            "question_type": request.quiz_type, # Map quiz_type to question_type for Edge Function
-            "num_questions": request.num_questions
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(edge_function_url, headers=headers, json=payload)
-            response.raise_for_status() # Raise an exception for 4xx/5xx responses
-
-            edge_function_response = response.json()
-            
-            # The Edge Function returns a JSON with a "questions" key
-            # We need to wrap it in quiz_data for QuizGenerationResponse
-            return QuizGenerationResponse(quiz_data=edge_function_response) # Assuming edge_function_response is already the quiz_data
+        edge_function_response = await quiz_generation_service.generate(
+            current_user, request, class_id, sb_admin, content_version=material.get("content_version")
+        )
+        # We need to wrap it in quiz_data for QuizGenerationResponse
+        return QuizGenerationResponse(quiz_data=edge_function_response) # Assuming edge_function_response is already the quiz_data
 
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except httpx.HTTPStatusError as e:
         print(f"HTTP error calling generate-quiz Edge Function: {e.response.status_code} - {e.response.text}")
         raise HTTPException(status_code=e.response.status_code, detail=f"Error from quiz generation service: {e.response.text}")
@@ -52,21 +82,187 @@ async def generate_quiz_endpoint(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+async def _run_batch_quiz_generation(
+    job: Job,
+    token: str,
+    request: QuizBatchGenerationRequest,
+    materials: list,
+    teacher_id: str,
+    sb_admin: Client,
+):
+    """Generates a draft quiz per material, a few materials at a time."""
+    await job_registry.update(job, status="running")
+    semaphore = asyncio.Semaphore(settings.quiz_batch_concurrency)
+
+    async def generate_for(material: dict):
+        async with semaphore:
+            try:
+                quiz_request = QuizGenerationRequest(
+                    material_id=material["id"],
+                    num_questions=request.num_questions,
+                    difficulty=request.difficulty,
+                    quiz_type=request.quiz_type,
+                    fresh=request.fresh,
+                )
+                quiz_data = await quiz_generation_service.generate(
+                    token, quiz_request, request.class_id, sb_admin, content_version=material.get("content_version")
+                )
+                questions = [
+                    QuestionIn(text=q["text"], type=request.quiz_type, options=q.get("options"), answer=q.get("answer"))
+                    for q in quiz_data.get("questions", [])
+                ]
+                if not questions:
+                    raise ValueError("The AI returned no questions for this material.")
+
+                # Persist as a draft through the regular quiz insertion path
+                draft = QuizIn(
+                    topic=material.get("topic") or "Generated quiz",
+                    type=request.quiz_type,
+                    duration_minutes=request.duration_minutes,
+                    questions=questions,
+                    status="draft",
+                )
+                new_quiz = insert_quiz(sb_admin, UUID(request.class_id), draft, teacher_id)
+                await job_registry.record_result(job, {
+                    "material_id": material["id"],
+                    "quiz_id": new_quiz["id"],
+                    "num_questions": len(questions),
+                })
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                print(f"Error generating batch quiz for material {material['id']}: {detail}")
+                await job_registry.record_error(job, {"material_id": material["id"], "error": detail})
+
+    await asyncio.gather(*(generate_for(material) for material in materials))
+    await job_registry.update(job, status="completed" if job.completed else "failed")
+
+def _get_owned_job(job_id: str, user: dict) -> Job:
+    job = job_registry.get(job_id)
+    if job is None or job.owner_id != str(user.get("id")):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
+@router.post("/generate-quiz/batch", status_code=status.HTTP_202_ACCEPTED, response_model=QuizBatchJobResponse)
+async def generate_quiz_batch_endpoint(
+    request: QuizBatchGenerationRequest,
+    background_tasks: BackgroundTasks,
+    current_user: str = Depends(get_raw_token),
+    current_teacher: dict = Depends(get_current_teacher_user),
+    sb_admin: Client = Depends(get_supabase_admin),
+):
+    """Starts a background job that generates a draft quiz for each given material of a class."""
+    verify_class_membership(class_id=UUID(request.class_id), user=current_teacher, sb_admin=sb_admin)
+    if not request.material_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="material_ids must not be empty.")
+    _check_admission(current_teacher, request.class_id)
+
+    material_ids = list(dict.fromkeys(request.material_ids))
+    materials_res = sb_admin.table("materials").select("id, topic, content_version")\
+        .eq("class_id", request.class_id)\
+        .in_("id", material_ids)\
+        .execute()
+    materials = materials_res.data or []
+
+    job = job_registry.create("quiz_generation", current_teacher.get("id"), total=len(material_ids))
+    found_ids = {str(m["id"]) for m in materials}
+    for material_id in material_ids:
+        if material_id not in found_ids:
+            await job_registry.record_error(job, {"material_id": material_id, "error": "Material not found in this class."})
+
+    background_tasks.add_task(
+        _run_batch_quiz_generation, job, current_user, request, materials, current_teacher.get("id"), sb_admin
+    )
+    return QuizBatchJobResponse(job_id=job.id)
+
+@router.get("/generate-quiz/batch/{job_id}")
+def get_quiz_batch_job(job_id: str, current_teacher: dict = Depends(get_current_teacher_user)):
+    """Returns the progress and partial results of a batch quiz generation job."""
+    return _get_owned_job(job_id, current_teacher).to_dict()
+
+@router.get("/generate-quiz/batch/{job_id}/events")
+async def stream_quiz_batch_job(job_id: str, current_teacher: dict = Depends(get_current_teacher_user)):
+    """Streams job progress as Server-Sent Events until the job finishes."""
+    job = _get_owned_job(job_id, current_teacher)
+
+    async def event_stream():
+        async for snapshot in job_registry.watch(job):
+            yield format_sse(snapshot, event="done" if snapshot["status"] in ("completed", "failed") else "progress")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # New endpoint for AI chat
-@router.post("/chat/{class_id}")
+@router.post("/chat/{class_id}", dependencies=[Depends(verify_class_membership)])
 async def ai_chat_endpoint(
     class_id: str,
     request: AIChatRequest,
+    http_request: Request,
     current_user: str = Depends(get_raw_token), # Changed to get_raw_token
+    user: dict = Depends(get_current_user),
+    sb: Client = Depends(get_supabase_admin), # Membership is verified above; the lexical index is shared per class
 ):
+    _check_admission(user, class_id)
+    priority = priority_for_user(user)
+
+    if request.stream:
+        async def event_stream():
+            events = rag_service.stream_ai_response_for_class(
+                user_id=current_user,
+                class_id=class_id,
+                question=request.question,
+                sb=sb,
+                priority=priority,
+            )
+            # aclosing() closes the upstream Edge Function stream as soon as we stop iterating
+            async with aclosing(events):
+                async for event in events:
+                    if await http_request.is_disconnected():
+                        print(f"Client disconnected from AI chat stream for class {class_id}, cancelling generation")
+                        break
+                    yield event
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     try:
         response = await rag_service.get_ai_response_for_class(
             user_id=current_user, # user_id is now the raw JWT token
             class_id=class_id,
-            question=request.question
+            question=request.question,
+            sb=sb,
+            priority=priority,
         )
         return {"response": response}
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/metrics")
+def ai_metrics(current_admin: dict = Depends(get_current_admin_user)):
+    """Returns runtime metrics of the AI pipeline (caches, queues) for this API process."""
+    return {
+        "lexical_index": lexical_index.stats(),
+        "answer_cache": answer_cache.stats(),
+        "chat_single_flight": rag_service.chat_flight.stats(),
+        "query_embeddings": embedding_service.stats(),
+        "context_packing": context_packer.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "ocr_page_cache": ocr_page_cache.stats(),
+        "ingestion": ingestion_admission.stats(),
+        "quiz_definitions": quiz_definition_cache.stats(),
+        "checkpoints": checkpoint_buffer.stats(),
+        "quiz_generation": quiz_generation_service.stats(),
+        "admission": ai_admission.stats(),
+        "jobs": job_registry.stats(),
+    }
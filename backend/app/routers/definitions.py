@@ -1,24 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import base64
+import csv
+import io
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from uuid import UUID
-import google.generativeai as genai
 
-from ..dependencies import get_current_user, get_supabase_admin
+from ..dependencies import get_current_user, get_supabase_admin, verify_class_membership
 from ..config import settings
+from ..services.answer_cache import answer_cache
+from ..services.embeddings import embedding_service
+from ..services.embedding_providers import TASK_DOCUMENT
+from ..services.jobs import Job, job_registry
+from ..services.sse import format_sse
+from ..services.text import normalize_text
 from supabase import Client # Import Client for type hinting
 
 router = APIRouter()
 
-# Configure Gemini for embedding generation
-print(f"DEBUG: GEMINI_API_KEY from settings: {settings.gemini_api_key[:5]}...{settings.gemini_api_key[-5:] if settings.gemini_api_key else 'None'}") # Debug print
-try:
-    genai.configure(api_key=settings.gemini_api_key)
-except Exception as e:
-    print(f"Tidak dapat mengkonfigurasi Gemini API key: {e}")
-
-embedding_model = genai.GenerativeModel('models/text-embedding-004') # No longer needed as a GenerativeModel instance
-
 class DefinitionCreate(BaseModel):
     term: str
     definition: str
@@ -34,20 +36,13 @@ class DefinitionResponse(BaseModel):
         from_attributes = True
 
 def generate_embedding(text: str) -> list[float]:
-    """Generates embedding for a given text using Gemini."""
+    """Generates embedding for a given text using the configured embedding provider."""
     try:
-        print(f"DEBUG: Calling genai.embed_content for text: {text[:50]}...") # Debug print
-        print(f"DEBUG: genai object type: {type(genai)}") # Debug print
-        print(f"DEBUG: genai.embed_content type: {type(genai.embed_content)}") # Debug print
-        
-        # Call genai.embed_content directly
-        result = genai.embed_content(model='models/text-embedding-004', content=[text], task_type="retrieval_document")
-        print(f"DEBUG: Embedding result: {result}") # Debug print
-        if result and 'embedding' in result and result['embedding'] and result['embedding'][0]:
-            return result['embedding'][0]
-        else:
-            print(f"DEBUG: generate_embedding returned no valid embedding for text: {text}")
-            return [] # Return empty list if no valid embedding
+        embeddings = embedding_service.provider.embed([text], TASK_DOCUMENT)
+        if embeddings and embeddings[0]:
+            return embeddings[0]
+        print(f"DEBUG: generate_embedding returned no valid embedding for text: {text}")
+        return [] # Return empty list if no valid embedding
     except Exception as e:
         print(f"ERROR in generate_embedding for text '{text}': {e}")
         raise # Re-raise to be caught by the outer try-except
@@ -80,6 +75,9 @@ async def add_definition(
 
         if not response.data:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add definition.")
+
+        # Global definitions (no class_id) can change answers in every class
+        answer_cache.invalidate(str(definition_data.class_id) if definition_data.class_id else None)
         
         return DefinitionResponse(**response.data[0])
 
@@ -87,20 +85,255 @@ async def add_definition(
         print(f"Error adding definition: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An error occurred: {str(e)}")
 
-@router.get("/definitions", response_model=List[DefinitionResponse])
+class DefinitionPage(BaseModel):
+    items: List[DefinitionResponse]
+    next_cursor: str | None = None # Pass as ?cursor= to fetch the next page
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row["term"], str(row["id"])]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        term, definition_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return term, str(UUID(definition_id))
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+@router.get("/definitions", response_model=DefinitionPage)
 async def get_definitions(
+    class_id: Optional[UUID] = None,
+    include_global: bool = True,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     sb_admin: Client = Depends(get_supabase_admin),
     current_user: dict = Depends(get_current_user),
 ):
-    """Fetches all general definitions from the database."""
+    """Lists definitions by term, one page at a time (without embeddings).
+
+    class_id limits the list to that class (plus global definitions unless include_global is false),
+    q matches a term prefix or a similar term.
+    """
     if current_user.get("role") not in ["admin", "teacher"]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admin or teachers can view definitions.")
 
+    after_term, after_id = _decode_cursor(cursor) if cursor else (None, None)
     try:
-        response = sb_admin.table("general_definitions").select("*").execute()
-        if not response.data:
-            return []
-        return [DefinitionResponse(**definition) for definition in response.data]
+        # One extra row tells whether there is a next page
+        response = sb_admin.rpc("list_general_definitions", {
+            "filter_class_id": str(class_id) if class_id else None,
+            "include_global": include_global,
+            "search": q.strip() if q and q.strip() else None,
+            "after_term": after_term,
+            "after_id": after_id,
+            "page_size": limit + 1,
+        }).execute()
+        rows = response.data or []
+        next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return DefinitionPage(items=[DefinitionResponse(**row) for row in rows[:limit]], next_cursor=next_cursor)
     except Exception as e:
         print(f"Error fetching definitions: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An error occurred: {str(e)}")
+
+class DefinitionSearchResult(BaseModel):
+    term: str
+    definition: str
+    class_id: UUID | None = None
+    similarity: float
+
+@router.get("/definitions/search", response_model=List[DefinitionSearchResult])
+async def search_definitions(
+    q: str,
+    class_id: Optional[UUID] = None,
+    k: int = Query(5, ge=1, le=50),
+    threshold: float = Query(0.0, ge=-1.0, le=1.0),
+    sb_admin: Client = Depends(get_supabase_admin),
+    current_user: dict = Depends(get_current_user),
+):
+    """Semantic search over global definitions plus those of the given class."""
+    if not q.strip():
+        return []
+    if class_id and current_user.get("role") != "admin":
+        verify_class_membership(class_id=class_id, user=current_user, sb_admin=sb_admin)
+    try:
+        query_embedding = await embedding_service.embed_query(q)
+        response = sb_admin.rpc("search_general_definitions", {
+            "query_embedding": query_embedding,
+            "filter_class_id": str(class_id) if class_id else None,
+            "match_count": k,
+            "match_threshold": threshold,
+        }).execute()
+        return response.data or []
+    except Exception as e:
+        print(f"Error searching definitions: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An error occurred: {str(e)}")
+
+# --- Bulk import ---
+
+class DefinitionImportResponse(BaseModel):
+    job_id: str
+    total: int
+
+def _parse_glossary(filename: str, content: bytes) -> Tuple[List[Tuple[int, str, str]], List[Dict[str, Any]]]:
+    """Parses a CSV (term,definition header) or JSON glossary into (row, term, definition) tuples and per-row errors."""
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("definitions", [])
+        if not isinstance(data, list):
+            raise ValueError("JSON glossary must be a list of {term, definition} objects.")
+        items = [(index, item) for index, item in enumerate(data, start=1)]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        if "term" not in reader.fieldnames or "definition" not in reader.fieldnames:
+            raise ValueError("CSV glossary must have 'term' and 'definition' columns.")
+        # Row 1 is the header
+        items = [(index, item) for index, item in enumerate(reader, start=2)]
+
+    rows, errors = [], []
+    for index, item in items:
+        if not isinstance(item, dict):
+            errors.append({"row": index, "error": "Row must be an object with term and definition."})
+            continue
+        term = str(item.get("term") or "").strip()
+        definition = str(item.get("definition") or "").strip()
+        if not term or not definition:
+            errors.append({"row": index, "term": term, "error": "Term and definition are required."})
+            continue
+        rows.append((index, term, definition))
+    return rows, errors
+
+def _existing_terms(sb_admin: Client, class_id: Optional[str]) -> set:
+    """Normalized terms already defined in the same scope (a class, or global)."""
+    terms, offset, page_size = set(), 0, 1000
+    while True:
+        query = sb_admin.table("general_definitions").select("term")
+        query = query.eq("class_id", class_id) if class_id else query.is_("class_id", "null")
+        data = query.order("id").range(offset, offset + page_size - 1).execute().data or []
+        terms.update(normalize_text(row["term"]) for row in data)
+        if len(data) < page_size:
+            return terms
+        offset += page_size
+
+async def _run_definition_import(job: Job, rows: List[Tuple[int, str, str]], class_id: Optional[str], sb_admin: Client):
+    """Embeds definitions in concurrent batches and inserts them page by page."""
+    await job_registry.update(job, status="running")
+    try:
+        existing = _existing_terms(sb_admin, class_id)
+    except Exception as e:
+        print(f"Error loading existing definitions for import: {e}")
+        await job_registry.update(job, status="failed", errors=job.errors + [{"error": f"Could not load existing definitions: {e}"}])
+        return
+
+    # Deduplicate per class: existing terms and repeats inside the file are skipped
+    first_row: Dict[str, int] = {}
+    unique_rows = []
+    for index, term, definition in rows:
+        key = normalize_text(term)
+        if key in existing:
+            await job_registry.record_error(job, {"row": index, "term": term, "error": "Term already exists."})
+        elif key in first_row:
+            await job_registry.record_error(job, {"row": index, "term": term, "error": f"Duplicate of row {first_row[key]}."})
+        else:
+            first_row[key] = index
+            unique_rows.append((index, term, definition))
+
+    pending: List[Tuple[int, Dict[str, Any]]] = []
+
+    async def flush():
+        page = pending[:]
+        pending.clear()
+        try:
+            response = sb_admin.table("general_definitions").insert([record for _, record in page]).execute()
+            inserted = response.data or []
+        except Exception as e:
+            print(f"Error inserting imported definitions: {e}")
+            for index, record in page:
+                await job_registry.record_error(job, {"row": index, "term": record["term"], "error": f"Insert failed: {e}"})
+            return
+        for (index, record), row in zip(page, inserted):
+            await job_registry.record_result(job, {"row": index, "term": record["term"], "id": row.get("id")})
+
+    semaphore = asyncio.Semaphore(settings.definition_import_concurrency)
+    batch_size = settings.definition_import_batch_size
+
+    async def embed_batch(batch: List[Tuple[int, str, str]]):
+        async with semaphore:
+            try:
+                embeddings = await embedding_service.embed_documents([definition for _, _, definition in batch])
+            except Exception as e:
+                print(f"Error embedding imported definitions: {e}")
+                for index, term, _ in batch:
+                    await job_registry.record_error(job, {"row": index, "term": term, "error": f"Embedding failed: {e}"})
+                return
+        for (index, term, definition), embedding in zip(batch, embeddings):
+            pending.append((index, {"term": term, "definition": definition, "class_id": class_id, "embedding": embedding}))
+        if len(pending) >= settings.definition_import_page_size:
+            await flush()
+
+    await asyncio.gather(*(
+        embed_batch(unique_rows[start:start + batch_size]) for start in range(0, len(unique_rows), batch_size)
+    ))
+    if pending:
+        await flush()
+
+    if job.completed:
+        answer_cache.invalidate(class_id)
+    await job_registry.update(job, status="failed" if unique_rows and not job.completed else "completed")
+
+def _get_owned_import_job(job_id: str, user: dict) -> Job:
+    job = job_registry.get(job_id)
+    if job is None or job.kind != "definition_import" or job.owner_id != str(user.get("id")):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
+@router.post("/definitions/import", status_code=status.HTTP_202_ACCEPTED, response_model=DefinitionImportResponse)
+async def import_definitions(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    class_id: Optional[UUID] = Form(None),
+    sb_admin: Client = Depends(get_supabase_admin),
+    current_user: dict = Depends(get_current_user),
+):
+    """Starts a background import of a CSV or JSON glossary. Progress is available via the job endpoints."""
+    if current_user.get("role") not in ["admin", "teacher"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admin or teachers can add definitions.")
+    if class_id and current_user.get("role") != "admin":
+        verify_class_membership(class_id=class_id, user=current_user, sb_admin=sb_admin)
+
+    try:
+        rows, errors = _parse_glossary(file.filename or "", await file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid glossary file: {e}")
+    total = len(rows) + len(errors)
+    if total > settings.definition_import_max_rows:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A glossary may contain at most {settings.definition_import_max_rows} rows.")
+
+    job = job_registry.create("definition_import", current_user.get("id"), total=total)
+    for error in errors:
+        await job_registry.record_error(job, error)
+
+    background_tasks.add_task(_run_definition_import, job, rows, str(class_id) if class_id else None, sb_admin)
+    return DefinitionImportResponse(job_id=job.id, total=total)
+
+@router.get("/definitions/import/{job_id}")
+def get_definition_import_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Returns progress and per-row results/errors of a glossary import."""
+    return _get_owned_import_job(job_id, current_user).to_dict()
+
+@router.get("/definitions/import/{job_id}/events")
+async def stream_definition_import_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Streams glossary import progress as Server-Sent Events until the import finishes."""
+    job = _get_owned_import_job(job_id, current_user)
+
+    async def event_stream():
+        async for snapshot in job_registry.watch(job):
+            yield format_sse(snapshot, event="done" if snapshot["status"] in ("completed", "failed") else "progress")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
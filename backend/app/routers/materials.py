@@ -108,7 +108,9 @@ async def upload_material(
 
         # 3. Trigger RAG processing in the background
         from backend.app.services.rag import process_material_for_rag # Import here to avoid circular dependency if rag imports from routers
-        background_tasks.add_task(process_material_for_rag, material_id, storage_path, sb_admin)
+        from backend.app.services.ingestion_admission import estimate_ingestion_bytes
+        estimated_bytes = estimate_ingestion_bytes(file_content, file.content_type)
+        background_tasks.add_task(process_material_for_rag, material_id, storage_path, sb_admin, estimated_bytes)
 
         return {"message": "Material uploaded successfully via RPC and RAG processing initiated.", "material_id": material_id}
 
@@ -164,7 +166,7 @@ def delete_material(
     user_id = current_teacher.get("id")
 
     # 1. Fetch material to get storage_path and verify ownership
-    material_res = sb_admin.table("materials").select("storage_path, user_id").eq("id", str(material_id)).single().execute()
+    material_res = sb_admin.table("materials").select("storage_path, user_id, class_id").eq("id", str(material_id)).single().execute()
     if not material_res.data:
         raise HTTPException(status_code=404, detail="Material not found.")
 
@@ -182,13 +184,41 @@ def delete_material(
             # Log the error but proceed to delete the DB record anyway
             print(f"Error deleting file from storage: {e}")
 
+    # Classes using the material (owner and class_materials links), read before the links are deleted
+    from backend.app.services.rag import material_class_ids
+    class_ids = material_class_ids(sb_admin, str(material_id))
+
     # 3. Delete the material record from the database
     delete_res = sb_admin.table("materials").delete().eq("id", str(material_id)).execute()
     if not delete_res.data:
         raise HTTPException(status_code=500, detail="Failed to delete material from database.")
 
+    # 4. Drop the material's chunks from the in-memory lexical (BM25) index and cached AI answers
+    from backend.app.services.lexical_index import lexical_index
+    from backend.app.services.answer_cache import answer_cache
+    lexical_index.remove_material(str(material_id))
+    for class_id in class_ids:
+        answer_cache.invalidate(class_id)
+
     return
 
+@router.post("/{material_id}/reprocess", status_code=status.HTTP_202_ACCEPTED)
+def reprocess_material(
+    material_id: UUID,
+    background_tasks: BackgroundTasks,
+    sb_admin: Client = Depends(get_supabase_admin),
+    current_teacher: dict = Depends(get_current_teacher_user),
+):
+    """Re-chunks and re-embeds a material from its cached extracted text. Only accessible by teachers of the class."""
+    material_res = sb_admin.table("materials").select("class_id").eq("id", str(material_id)).single().execute()
+    if not material_res.data:
+        raise HTTPException(status_code=404, detail="Material not found.")
+    verify_class_membership(class_id=material_res.data["class_id"], user=current_teacher, sb_admin=sb_admin)
+
+    from backend.app.services.rag import reprocess_material_for_rag
+    background_tasks.add_task(reprocess_material_for_rag, str(material_id), sb_admin)
+    return {"message": "Material reprocessing initiated."}
+
 class MaterialAccessResponse(BaseModel):
     user_id: UUID
     accessed_at: str
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+import hashlib
 import uuid
 from uuid import UUID
 from datetime import datetime, timezone
 
 from ..dependencies import get_supabase, get_supabase_admin, get_current_user, get_current_teacher_user, get_current_student_user, verify_class_membership, verify_quiz_membership
+from ..services.quiz_cache import QuizDefinition, quiz_definition_cache
+from ..services.checkpoint_buffer import CheckpointBufferFull, checkpoint_buffer
 from supabase import Client
+from postgrest.exceptions import APIError
 
 router = APIRouter()
 
@@ -76,11 +80,21 @@ class QuizWithQuestions(QuizOut):
     available_from: Optional[datetime] = None
     available_until: Optional[datetime] = None
 
+# Per-student part of QuizWithQuestions, merged into the cached student payload
+class QuizAttemptState(BaseModel):
+    current_attempt_number: int = 1
+    started_at: Optional[datetime] = None
+    result_id: Optional[UUID] = None
+
 class CheckpointIn(BaseModel):
     question_id: UUID
     answer: str
     attempt_number: int
 
+class CheckpointBatchIn(BaseModel):
+    attempt_number: int
+    answers: Dict[UUID, str] # {question_id: answer}
+
 class CheckpointOut(BaseModel):
     id: UUID
     user_id: UUID
@@ -93,6 +107,10 @@ class CheckpointOut(BaseModel):
     class Config:
         from_attributes = True
 
+class CheckpointAck(BaseModel):
+    accepted: int
+    attempt_number: int
+
 class QuizSubmissionIn(BaseModel):
     result_id: UUID
     user_answers: dict # {question_id: answer_text}
@@ -105,6 +123,104 @@ class QuizAttemptStartOut(BaseModel):
     started_at: datetime
     attempt_number: int
 
+# --- Helpers ---
+def insert_quiz(sb: Client, class_id: UUID, payload: QuizIn, teacher_id: str) -> dict:
+    """Inserts a quiz with its questions and visibility rows. Returns the new quiz row."""
+    if any(q.type != payload.type for q in payload.questions):
+        raise HTTPException(status_code=400, detail="All question types must match the quiz type.")
+
+    quiz_res = sb.table("quizzes").insert({
+        "class_id": str(class_id),
+        "topic": payload.topic,
+        "type": payload.type,
+        "duration_minutes": payload.duration_minutes,
+        "max_attempts": payload.max_attempts,
+        "weight": payload.weight,
+        "available_from": payload.available_from.isoformat() if payload.available_from else None,
+        "available_until": payload.available_until.isoformat() if payload.available_until else None,
+        "status": payload.status,
+        "created_by": teacher_id, # Add this line
+    }).execute()
+    
+    if not quiz_res.data:
+        raise HTTPException(status_code=500, detail="Failed to create quiz.")
+    
+    new_quiz = quiz_res.data[0]
+    questions_to_insert = []
+    for q in payload.questions:
+        q_dict = q.model_dump(exclude={'id'})
+        q_dict["quiz_id"] = new_quiz['id']
+        if q.type == "essay":
+            q_dict["answer"] = None  # Essay questions don't have a predefined correct answer
+        elif q.type in ["mcq", "true_false"] and q_dict.get("max_score") is None: # NEW LOGIC
+            q_dict["max_score"] = 100 # Default max_score for MCQ/TrueFalse
+        print(f"DEBUG: Question to insert: {q_dict}")
+        questions_to_insert.append(q_dict)
+    
+    questions_res = sb.table("questions").insert(questions_to_insert).execute()
+
+    if not questions_res.data:
+        sb.table("quizzes").delete().eq("id", new_quiz['id']).execute()
+        raise HTTPException(status_code=500, detail="Failed to create questions for the quiz.")
+
+    if payload.visible_to is not None:
+        visibility_to_insert = [
+            {"quiz_id": new_quiz['id'], "user_id": str(student_id)} for student_id in payload.visible_to
+        ]
+        if visibility_to_insert:
+            sb.table("quiz_visibility").insert(visibility_to_insert).execute()
+
+    # Drop anything cached while the questions were still being inserted
+    quiz_definition_cache.invalidate(new_quiz['id'])
+    return new_quiz
+
+def _quiz_details_data(definition: QuizDefinition, strip_answers: bool) -> dict:
+    quiz_data = dict(definition.quiz)
+    # Rename 'classes' to 'class_info' to match frontend model if needed
+    if quiz_data.get("classes"):
+        quiz_data["classes"] = {"name": quiz_data["classes"]["class_name"]}
+    questions = definition.questions
+    if strip_answers:
+        questions = [{**q, "answer": None} for q in questions]
+    return {**quiz_data, "questions": questions, "visible_to": definition.visible_to}
+
+def _student_quiz_payload(definition: QuizDefinition):
+    """Serializes the answer-free quiz details once per cached definition.
+
+    Returns the JSON object without its closing brace, so the per-student
+    attempt fields can be appended, and the definition's ETag part.
+    """
+    if definition.student_payload is None:
+        body = QuizWithQuestions.model_validate(_quiz_details_data(definition, strip_answers=True))\
+            .model_dump_json(exclude=set(QuizAttemptState.model_fields)).encode()
+        definition.student_etag = hashlib.sha256(body).hexdigest()[:16]
+        definition.student_payload = body[:-1]
+    return definition.student_payload, definition.student_etag
+
+def _checkpoint_rows(definition: QuizDefinition, user_id: str, attempt_number: int, answers: Dict[UUID, str]) -> List[dict]:
+    """Builds quiz_checkpoints rows, rejecting question ids that are not part of the quiz."""
+    unknown = [str(q_id) for q_id in answers if str(q_id) not in definition.answer_key]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Questions not in this quiz: {', '.join(unknown)}")
+    updated_at = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "user_id": str(user_id),
+            "quiz_id": definition.quiz_id,
+            "question_id": str(q_id),
+            "answer": answer,
+            "attempt_number": attempt_number,
+            "updated_at": updated_at,
+        }
+        for q_id, answer in answers.items()
+    ]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
 # --- Endpoints ---
 @router.post("/{class_id}", status_code=status.HTTP_201_CREATED, response_model=QuizOut, dependencies=[Depends(verify_class_membership)])
 def create_quiz(
@@ -117,52 +233,10 @@ def create_quiz(
     print(f"DEBUG: create_quiz called by teacher {teacher_id}")
     print(f"DEBUG: QuizIn payload: {payload.model_dump_json()}")
 
-    if any(q.type != payload.type for q in payload.questions):
-        raise HTTPException(status_code=400, detail="All question types must match the quiz type.")
-
     try:
-        quiz_res = sb.table("quizzes").insert({
-            "class_id": str(class_id),
-            "topic": payload.topic,
-            "type": payload.type,
-            "duration_minutes": payload.duration_minutes,
-            "max_attempts": payload.max_attempts,
-            "weight": payload.weight,
-            "available_from": payload.available_from.isoformat() if payload.available_from else None,
-            "available_until": payload.available_until.isoformat() if payload.available_until else None,
-            "status": payload.status,
-            "created_by": teacher_id, # Add this line
-        }).execute()
-        
-        if not quiz_res.data:
-            raise HTTPException(status_code=500, detail="Failed to create quiz.")
-        
-        new_quiz = quiz_res.data[0]
-        questions_to_insert = []
-        for q in payload.questions:
-            q_dict = q.model_dump(exclude={'id'})
-            q_dict["quiz_id"] = new_quiz['id']
-            if q.type == "essay":
-                q_dict["answer"] = None  # Essay questions don't have a predefined correct answer
-            elif q.type in ["mcq", "true_false"] and q_dict.get("max_score") is None: # NEW LOGIC
-                q_dict["max_score"] = 100 # Default max_score for MCQ/TrueFalse
-            print(f"DEBUG: Question to insert: {q_dict}")
-            questions_to_insert.append(q_dict)
-        
-        questions_res = sb.table("questions").insert(questions_to_insert).execute()
-
-        if not questions_res.data:
-            sb.table("quizzes").delete().eq("id", new_quiz['id']).execute()
-            raise HTTPException(status_code=500, detail="Failed to create questions for the quiz.")
-
-        if payload.visible_to is not None:
-            visibility_to_insert = [
-                {"quiz_id": new_quiz['id'], "user_id": str(student_id)} for student_id in payload.visible_to
-            ]
-            if visibility_to_insert:
-                sb.table("quiz_visibility").insert(visibility_to_insert).execute()
-
-        return new_quiz
+        return insert_quiz(sb, class_id, payload, teacher_id)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
@@ -246,6 +320,9 @@ def update_quiz(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    finally:
+        # Even a partially applied update must not leave the old definition cached
+        quiz_definition_cache.invalidate(quiz_id)
 
 @router.patch("/{quiz_id}/settings", status_code=status.HTTP_204_NO_CONTENT)
 def update_quiz_settings(
@@ -281,6 +358,8 @@ def update_quiz_settings(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An error occurred while updating quiz settings: {str(e)}")
+    finally:
+        quiz_definition_cache.invalidate(quiz_id)
 
     return
 
@@ -367,15 +446,23 @@ def list_quizzes(
 def get_quiz_details(
     quiz_id: UUID,
     sb: Client = Depends(get_supabase),
+    sb_admin: Client = Depends(get_supabase_admin),
     current_user: dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
-    """Retrieves details for a specific quiz, including its questions."""
-    quiz_res = sb.table("quizzes").select("*, classes(class_name)").eq("id", str(quiz_id)).single().execute()
-    if not quiz_res.data:
+    """
+    Retrieves details for a specific quiz, including its questions.
+    Students get a precompiled payload without answers, with ETag revalidation.
+    """
+    definition = quiz_definition_cache.get(sb_admin, quiz_id)
+    if definition is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
-    quiz_data = quiz_res.data
+    quiz_data = definition.quiz
     user_role = current_user.get('role')
+    # The definition is shared across users, so class access is checked here instead of by RLS
+    if user_role != 'admin':
+        verify_class_membership(class_id=definition.class_id, user=current_user, sb_admin=sb_admin)
     user_id = current_user.get("id")
     print(f"DEBUG: get_quiz_details called for user_id: {user_id}, quiz_id: {quiz_id}")
 
@@ -398,12 +485,6 @@ def get_quiz_details(
             if now > available_until:
                 raise HTTPException(status_code=403, detail="The deadline for this quiz has passed.")
 
-    # RLS on the 'quizzes' table already ensures the user has access.
-    
-    questions_res = sb.table("questions").select("*").eq("quiz_id", str(quiz_id)).execute()
-    visibility_res = sb.table("quiz_visibility").select("user_id").eq("quiz_id", str(quiz_id)).execute()
-    visible_to_ids = [item['user_id'] for item in visibility_res.data]
-
     # Add current_attempt_number logic here
     user_id = current_user.get("id")
     started_at_val = None
@@ -431,11 +512,18 @@ def get_quiz_details(
             # Frontend will display 'Start Quiz' button
             print(f"DEBUG: No existing unfinished attempt found for quiz {quiz_id} and user {user_id}.")
 
-    # Rename 'classes' to 'class_info' to match frontend model if needed
-    if quiz_data.get("classes"):
-        quiz_data["classes"] = {"name": quiz_data["classes"]["class_name"]}
+    attempt_state = QuizAttemptState(current_attempt_number=current_attempt_number, started_at=started_at_val, result_id=result_id_val)
+
+    if user_role == 'student':
+        payload, definition_etag = _student_quiz_payload(definition)
+        attempt_json = attempt_state.model_dump_json().encode()
+        etag = f'"{definition_etag}-{hashlib.sha256(attempt_json).hexdigest()[:12]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=payload + b"," + attempt_json[1:], media_type="application/json", headers=headers)
 
-    return {**quiz_data, "questions": questions_res.data or [], "visible_to": visible_to_ids, "current_attempt_number": current_attempt_number, "started_at": started_at_val, "result_id": result_id_val}
+    return {**_quiz_details_data(definition, strip_answers=False), **attempt_state.model_dump()}
 
 
 @router.delete("/{quiz_id}", status_code=204)
@@ -450,6 +538,7 @@ async def delete_quiz(quiz_id: str, user: dict = Depends(get_current_teacher_use
     
     # Then delete the quiz itself
     response = sb.from_('quizzes').delete().eq('id', quiz_id).execute()
+    quiz_definition_cache.invalidate(quiz_id)
     if not response.data:
         raise HTTPException(status_code=404, detail="Quiz not found or already deleted")
     return 
@@ -495,45 +584,43 @@ async def duplicate_quiz(quiz_id: str, user: dict = Depends(get_current_teacher_
                 question_data["max_score"] = oq['max_score']
             questions_to_insert.append(question_data)
         sb.from_('questions').insert(questions_to_insert).execute()
-    
+
+    # The copy was visible (without questions) before the insert above
+    quiz_definition_cache.invalidate(new_quiz['id'])
     return new_quiz
 
-@router.post("/{quiz_id}/checkpoint", status_code=status.HTTP_200_OK, response_model=CheckpointOut)
+def _checkpoints_unavailable(e: CheckpointBufferFull) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Checkpoints cannot be saved right now; please retry.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+@router.post("/{quiz_id}/checkpoint", status_code=status.HTTP_202_ACCEPTED, response_model=CheckpointAck)
 async def save_quiz_checkpoint(
     quiz_id: UUID,
     payload: CheckpointIn,
-    sb: Client = Depends(get_supabase), # RLS-enabled client
+    sb_admin: Client = Depends(get_supabase_admin),
     current_student: dict = Depends(get_current_student_user),
     is_member: bool = Depends(verify_quiz_membership)
 ):
-    """Saves a student's partial answer for a quiz as a checkpoint."""
+    """
+    Saves a student's partial answer for a quiz as a checkpoint.
+    The answer is buffered and written in batches; only the latest answer per question is kept.
+    """
     user_id = current_student.get("id")
 
     try:
         # Verify the quiz exists and belongs to the class
-        quiz_check = sb.table("quizzes").select("id, class_id").eq("id", str(quiz_id)).single().execute()
-        if not quiz_check.data:
+        definition = await quiz_definition_cache.aget(sb_admin, quiz_id)
+        if definition is None:
             raise HTTPException(status_code=404, detail="Quiz not found.")
         
-        # RLS on quiz_checkpoints will ensure user_id matches auth.uid()
-        checkpoint_data = {
-            "user_id": str(user_id),
-            "quiz_id": str(quiz_id),
-            "question_id": str(payload.question_id),
-            "answer": payload.answer,
-            "attempt_number": payload.attempt_number,
-        }
-        
-        # Upsert the checkpoint
-        response = sb.table("quiz_checkpoints").upsert(
-            checkpoint_data,
-            on_conflict="user_id,quiz_id,question_id,attempt_number"
-        ).execute()
-
-        if not response.data:
-            raise HTTPException(status_code=500, detail="Failed to save checkpoint.")
-        
-        return response.data[0]
+        # user_id comes from the verified token, so the buffered (admin) write stays scoped to the student
+        checkpoint_buffer.add(_checkpoint_rows(definition, user_id, payload.attempt_number, {payload.question_id: payload.answer}))
+        return {"accepted": 1, "attempt_number": payload.attempt_number}
+    except CheckpointBufferFull as e:
+        raise _checkpoints_unavailable(e)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -543,11 +630,42 @@ async def save_quiz_checkpoint(
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+@router.post("/{quiz_id}/checkpoint/batch", status_code=status.HTTP_200_OK, response_model=CheckpointAck)
+async def save_quiz_checkpoints_batch(
+    quiz_id: UUID,
+    payload: CheckpointBatchIn,
+    sb_admin: Client = Depends(get_supabase_admin),
+    current_student: dict = Depends(get_current_student_user),
+    is_member: bool = Depends(verify_quiz_membership)
+):
+    """
+    Saves several answers of one attempt at once (full page state, reconnect recovery).
+    The answers are written in a single upsert before the response is returned.
+    """
+    user_id = current_student.get("id")
+
+    definition = await quiz_definition_cache.aget(sb_admin, quiz_id)
+    if definition is None:
+        raise HTTPException(status_code=404, detail="Quiz not found.")
+    if not payload.answers:
+        return {"accepted": 0, "attempt_number": payload.attempt_number}
+
+    # Going through the buffer replaces any older buffered answers for the same questions
+    try:
+        checkpoint_buffer.add(_checkpoint_rows(definition, user_id, payload.attempt_number, payload.answers))
+    except CheckpointBufferFull as e:
+        raise _checkpoints_unavailable(e)
+    if not await checkpoint_buffer.flush(user_id, quiz_id, payload.attempt_number):
+        raise HTTPException(status_code=503, detail="Checkpoints could not be saved yet; they will be retried.")
+    return {"accepted": len(payload.answers), "attempt_number": payload.attempt_number}
+
+
 @router.get("/{quiz_id}/checkpoint", response_model=List[CheckpointOut])
 async def get_quiz_checkpoints(
     quiz_id: UUID,
     attempt_number: int,
     sb: Client = Depends(get_supabase), # RLS-enabled client
+    sb_admin: Client = Depends(get_supabase_admin),
     current_student: dict = Depends(get_current_student_user),
     is_member: bool = Depends(verify_quiz_membership)
 ):
@@ -556,10 +674,12 @@ async def get_quiz_checkpoints(
 
     try:
         # Verify the quiz exists and belongs to the class
-        quiz_check = sb.table("quizzes").select("id, class_id").eq("id", str(quiz_id)).single().execute()
-        if not quiz_check.data:
+        if await quiz_definition_cache.aget(sb_admin, quiz_id) is None:
             raise HTTPException(status_code=404, detail="Quiz not found.")
 
+        # Answers still in the write-behind buffer must be visible on reload
+        await checkpoint_buffer.flush(user_id, quiz_id, attempt_number)
+
         # RLS on quiz_checkpoints will ensure user_id matches auth.uid()
         response = sb.table("quiz_checkpoints").select("*")\
             .eq("user_id", str(user_id))\
@@ -584,126 +704,50 @@ async def submit_quiz(
     current_student: dict = Depends(get_current_student_user),
     is_member: bool = Depends(verify_quiz_membership)
 ):
-    """Submits a student's quiz answers, calculates score, and marks the quiz as ended."""
+    """
+    Submits a student's quiz answers, calculates score, and marks the quiz as ended.
+    The answers are graded with the cached answer key; all writes run in one
+    transaction (submit_quiz_attempt), and retries return the stored outcome.
+    """
     user_id = current_student.get("id")
 
-    # 1. Verify the result entry and that it belongs to the user and is not yet ended
-    result_res = sb.table("results").select("id, quiz_id, user_id, ended_at, attempt_number")\
-        .eq("id", str(payload.result_id))\
-        .eq("quiz_id", str(quiz_id))\
-        .eq("user_id", user_id)\
-        .single()\
-        .execute()
-
-    if not result_res.data:
-        raise HTTPException(status_code=404, detail="Quiz attempt not found or does not belong to user.")
-    
-    result_data = result_res.data
-    if result_data.get("ended_at"):
-        raise HTTPException(status_code=400, detail="Quiz has already been submitted.")
-
-    attempt_number = result_data["attempt_number"]
-
-    # 2. Fetch quiz questions and correct answers
-    questions_res = sb.table("questions").select("id, type, answer, max_score")\
-        .eq("quiz_id", str(quiz_id))\
-        .execute()
-    
-    if not questions_res.data:
+    definition = await quiz_definition_cache.aget(sb, quiz_id)
+    if definition is None:
+        raise HTTPException(status_code=404, detail="Could not find quiz details.")
+    if not definition.questions:
         raise HTTPException(status_code=404, detail="Questions for this quiz not found.")
-    
-    questions_map = {UUID(q["id"]): q for q in questions_res.data}
+    graded = definition.answer_key.grade(payload.user_answers)
 
-    # 3. Calculate score and store individual answers
-    # Fetch quiz details including its weight
-    quiz_details_res = sb.table("quizzes").select("class_id, weight").eq("id", str(quiz_id)).single().execute()
-    if not quiz_details_res.data:
-        raise HTTPException(status_code=404, detail="Could not find quiz details.")
-    quiz_weight = quiz_details_res.data['weight']
-
-    mcq_correct = 0
-    tf_correct = 0
-    mcq_total = 0
-    tf_total = 0
-    essay_questions_present = False
-
-    answers_to_insert = []
-    essay_submissions_to_insert = []
-
-    for q_id_str, user_answer in payload.user_answers.items():
-        q_id = UUID(q_id_str)
-        question = questions_map.get(q_id)
-
-        if not question:
-            continue
-
-        is_correct = False
-        if question["type"] == "mcq":
-            mcq_total += 1
-            if str(user_answer).lower().strip() == str(question.get("answer")).lower().strip():
-                mcq_correct += 1
-                is_correct = True
-        elif question["type"] == "true_false":
-            tf_total += 1
-            if str(user_answer).lower().strip() == str(question.get("answer")).lower().strip():
-                tf_correct += 1
-                is_correct = True
-        elif question["type"] == "essay":
-            essay_questions_present = True
-            essay_submissions_to_insert.append({
-                "quiz_result_id": str(payload.result_id),
-                "quiz_question_id": str(q_id),
-                "student_answer": user_answer,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            })
-            # Essay questions do not contribute to the immediate score calculation
-            continue
-
-        answers_to_insert.append({
-            "result_id": str(payload.result_id),
-            "question_id": str(q_id),
-            "user_id": user_id,
-            "answer": user_answer,
-            "is_correct": is_correct if question["type"] in ["mcq", "true_false"] else None,
-            "attempt_number": attempt_number
-        })
-
-    # Calculate score based on correct answers for auto-graded questions
-    total_auto_graded_questions = mcq_total + tf_total
-    score = 0
-    if total_auto_graded_questions > 0:
-        correct_auto_graded_answers = mcq_correct + tf_correct
-        score = round((correct_auto_graded_answers / total_auto_graded_questions) * 100)
-
-    if answers_to_insert:
-        sb.table("quiz_answers").insert(answers_to_insert).execute()
-
-    if essay_submissions_to_insert:
-        sb.table("essay_submissions").insert(essay_submissions_to_insert).execute()
-
-    # 4. Update the results table
-    update_data = {
-        "score": score,
-        "total": 100, # Total is now always 100 as score is a percentage
-        "ended_at": datetime.now(timezone.utc).isoformat(),
-        "status": "pending_review" if essay_questions_present else "completed"
-    }
-    print(f"DEBUG: Attempting to update result {payload.result_id} with data: {update_data}")
-    try:
-        # The .execute() method on Supabase client v2 raises an exception on failure,
-        # so we don't need to check for an 'error' attribute anymore.
-        update_res = sb.table("results").update(update_data).eq("id", str(payload.result_id)).execute()
-        print(f"DEBUG: Update response data: {update_res.data}")
-        print(f"DEBUG: Quiz result {payload.result_id} successfully updated with ended_at: {update_data['ended_at']}")
-    except Exception as e:
-        # This block will now catch API errors from the Supabase client as well as other exceptions.
-        print(f"ERROR: Exception during result update for {payload.result_id}: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"An error occurred during quiz result update: {str(e)}")
+    # Buffered checkpoints of this quiz must be written before the attempt is closed
+    if not await checkpoint_buffer.flush(user_id, quiz_id):
+        raise HTTPException(status_code=503, detail="Saved answers could not be written yet; please submit again.")
 
-    return {"message": "Quiz submitted successfully", "score": score, "total": 100, "status": update_data["status"]}
+    try:
+        response = sb.rpc("submit_quiz_attempt", {
+            "p_result_id": str(payload.result_id),
+            "p_quiz_id": str(quiz_id),
+            "p_user_id": str(user_id),
+            "p_score": graded.score,
+            "p_total": graded.total,
+            "p_status": graded.status,
+            "p_answers": [
+                {"question_id": question_id, "answer": answer, "is_correct": is_correct}
+                for question_id, answer, is_correct in graded.answers
+            ],
+            "p_essays": [{"question_id": question_id, "answer": answer} for question_id, answer in graded.essays],
+        }).execute()
+    except APIError as e:
+        if e.code == "P0002":
+            raise HTTPException(status_code=404, detail="Quiz attempt not found or does not belong to user.")
+        if e.code == "P0001":
+            raise HTTPException(status_code=400, detail=e.message)
+        print(f"ERROR: submit_quiz_attempt failed for {payload.result_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred during quiz submission: {e.message}")
+
+    outcome = response.data
+    if outcome["already_submitted"]:
+        print(f"DEBUG: Repeated submission of result {payload.result_id}; returning the stored outcome.")
+    return {"message": "Quiz submitted successfully", "score": outcome["score"], "total": outcome["total"], "status": outcome["status"]}
 
 @router.post("/{quiz_id}/cancel", status_code=status.HTTP_200_OK)
 async def cancel_quiz_attempt(
@@ -773,10 +817,10 @@ async def start_quiz_attempt(
         raise HTTPException(status_code=400, detail="An unfinished quiz attempt already exists. Please resume or cancel it.")
 
     # 2. Get max_attempts from the quiz
-    quiz_res = sb.table("quizzes").select("max_attempts").eq("id", str(quiz_id)).single().execute()
-    if not quiz_res.data:
+    definition = await quiz_definition_cache.aget(sb, quiz_id)
+    if definition is None:
         raise HTTPException(status_code=404, detail="Quiz not found.")
-    max_attempts = quiz_res.data.get('max_attempts') or 1 # Default to 1 if not set
+    max_attempts = definition.quiz.get('max_attempts') or 1 # Default to 1 if not set
 
     # 3. Count all previous attempts for this user and quiz (finished or not).
     # An attempt is counted as soon as it is started.
@@ -5,6 +5,8 @@ from uuid import UUID
 from datetime import datetime, timezone
 
 from ..dependencies import get_supabase, get_supabase_admin, get_current_user, get_current_student_user, get_current_teacher_user, verify_class_membership
+from ..services.quiz_cache import quiz_definition_cache
+from ..services.checkpoint_buffer import checkpoint_buffer
 from supabase import Client
 
 async def _finalize_quiz_result_score(quiz_result_id: UUID, sb: Client):
@@ -438,66 +440,45 @@ async def submit_quiz(
     quiz_id = UUID(result_data["quiz_id"])
     started_at = datetime.fromisoformat(result_data["started_at"])
     attempt_number = result_data["attempt_number"]
+    # Buffered checkpoints must reach the table before they are cleared below
+    if not await checkpoint_buffer.flush(student_id, quiz_id, attempt_number):
+        raise HTTPException(status_code=503, detail="Saved answers could not be written yet; please submit again.")
 
-    # 2. Fetch quiz details for questions and max_attempts
-    quiz_res = sb_admin.table("quizzes").select("id, type, max_attempts").eq("id", str(quiz_id)).single().execute()
-    if not quiz_res.data:
+    # 2. Fetch quiz details for questions and max_attempts (cached quiz definition)
+    definition = await quiz_definition_cache.aget(sb_admin, quiz_id)
+    if definition is None:
         raise HTTPException(status_code=404, detail="Associated quiz not found.")
     
-    quiz_type = quiz_res.data["type"]
-    max_attempts = quiz_res.data["max_attempts"]
+    quiz_type = definition.quiz["type"]
+    max_attempts = definition.quiz["max_attempts"]
 
-    # 3. Fetch all questions for grading
-    questions_res = sb_admin.table("questions").select("id, type, answer, max_score").eq("quiz_id", str(quiz_id)).execute()
-    if not questions_res.data:
+    # 3. Questions for grading
+    if not definition.questions:
         raise HTTPException(status_code=404, detail="Questions for this quiz not found.")
     
-    quiz_questions = {str(q['id']): q for q in questions_res.data}
-
-    score = 0
-    total_possible_score = 0 # Renamed from total_questions
-
-    answers_to_insert = []
-    essay_submissions_to_insert = []
-    has_essays = False
-
     print(f"DEBUG: User answers received: {payload.user_answers}")
-    for question_id_str, user_answer in payload.user_answers.items():
-        question_data = quiz_questions.get(question_id_str)
-        if not question_data:
-            print(f"DEBUG: Question data not found for {question_id_str}. Skipping.")
-            continue
-
-        question_type = question_data.get('type')
-        print(f"DEBUG: Processing question {question_id_str}, type: {question_type}, answer: {user_answer}")
-        
-        if question_type == 'essay':
-            has_essays = True
-            essay_submission_entry = {
-                "quiz_result_id": str(payload.result_id),
-                "quiz_question_id": question_id_str,
-                "student_answer": user_answer,
-            }
-            print(f"DEBUG: Appending essay submission entry: {essay_submission_entry}")
-            essay_submissions_to_insert.append(essay_submission_entry)
-            total_possible_score += question_data.get('max_score', 0) # Add max_score for essay
-        elif question_type in ['mcq', 'true_false']:
-            question_max_score = question_data.get('max_score')
-            if question_max_score is None:
-                question_max_score = 1 # Default to 1 if max_score is None in DB
-            
-            total_possible_score += question_max_score
-            is_correct = str(question_data.get('answer', '')).strip().lower() == str(user_answer).strip().lower()
-            if is_correct:
-                score += question_max_score # Add question_max_score if correct
-            
-            answers_to_insert.append({
-                "result_id": str(payload.result_id),
-                "question_id": question_id_str,
-                "user_id": student_id,
-                "answer": user_answer,
-                "is_correct": is_correct,
-            })
+    graded = definition.answer_key.grade(payload.user_answers)
+    score = graded.score
+    total_possible_score = graded.total
+
+    answers_to_insert = [
+        {
+            "result_id": str(payload.result_id),
+            "question_id": question_id,
+            "user_id": student_id,
+            "answer": answer,
+            "is_correct": is_correct,
+        }
+        for question_id, answer, is_correct in graded.answers
+    ]
+    essay_submissions_to_insert = [
+        {
+            "quiz_result_id": str(payload.result_id),
+            "quiz_question_id": question_id,
+            "student_answer": answer,
+        }
+        for question_id, answer in graded.essays
+    ]
     print(f"DEBUG: Final essay_submissions_to_insert before DB call: {essay_submissions_to_insert}")
     
     # 4. Update the main result record
@@ -511,7 +492,7 @@ async def submit_quiz(
             "score": score,
             "total": total_possible_score, # Use total_possible_score here
             "ended_at": now.isoformat(),
-            "status": "pending_review" if has_essays else "completed",
+            "status": graded.status,
         }
         result_update_res = sb_admin.table("results").update(update_data).eq("id", str(payload.result_id)).execute()
 
@@ -542,6 +523,8 @@ async def submit_quiz(
             print(f"ERROR: Failed to insert essay submissions: {e}")
 
     # 6. Delete checkpoints for this quiz and student
+    # Checkpoints buffered after the flush above would otherwise be written back later
+    checkpoint_buffer.discard(student_id, quiz_id, attempt_number)
     try:
         sb_admin.table("quiz_checkpoints").delete()\
             .eq("user_id", str(student_id))\
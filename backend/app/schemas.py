@@ -6,6 +6,20 @@ class QuizGenerationRequest(BaseModel):
     num_questions: int
     difficulty: str # e.g., "easy", "medium", "hard"
     quiz_type: str # e.g., "multiple_choice", "essay"
+    fresh: bool = False # Skip the generated-quiz cache and create a new variant
 
 class QuizGenerationResponse(BaseModel):
     quiz_data: Dict[str, Any] # Assuming quiz_data is a dictionary
+
+
+class QuizBatchGenerationRequest(BaseModel):
+    class_id: str
+    material_ids: List[str]
+    num_questions: int
+    difficulty: str
+    quiz_type: str
+    duration_minutes: int = 30 # Duration of the generated draft quizzes
+    fresh: bool = False
+
+class QuizBatchJobResponse(BaseModel):
+    job_id: str
@@ -0,0 +1,228 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from ..config import settings
+
+# Prioritas antrean: angka kecil dilayani lebih dulu
+PRIORITY_TEACHER = 0
+PRIORITY_STUDENT = 1
+
+_BUCKET_SWEEP_INTERVAL_SECONDS = 60
+
+
+class AdmissionRejected(Exception):
+    """Permintaan ditolak karena batas laju atau antrean penuh; router memetakannya ke HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Detik hingga satu token tersedia (0 jika sudah ada), tanpa mengambilnya."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def try_acquire(self) -> float:
+        """Mengambil satu token. Mengembalikan 0 jika berhasil, atau detik hingga token tersedia."""
+        wait = self.wait_time()
+        if not wait:
+            self.take()
+        return wait
+
+    def is_idle(self, now: float) -> bool:
+        """True jika bucket sudah terisi penuh kembali, sehingga sama dengan bucket baru."""
+        return now - self.updated_at >= (self.capacity - self.tokens) / self.rate
+
+
+def priority_for_user(user: dict) -> int:
+    return PRIORITY_TEACHER if user.get("role") in ["teacher", "admin"] else PRIORITY_STUDENT
+
+
+class AdmissionController:
+    """Pembatas laju dan antrean adil untuk pemanggilan AI (Gemini) di proses ini.
+
+    - check(): token bucket per pengguna dan per kelas, ditolak cepat bila habis.
+    - slot(): membatasi jumlah pemanggilan hulu yang berjalan bersamaan. Permintaan
+      berlebih menunggu di antrean terbatas; antrean dilayani per prioritas (guru
+      lebih dulu) dan bergiliran antar kelas agar satu kelas tidak memonopoli kuota.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_size: int,
+        max_wait_seconds: float,
+        user_rate_per_minute: float,
+        user_burst: int,
+        class_rate_per_minute: float,
+        class_burst: int,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.class_rate = class_rate_per_minute / 60
+        self.class_burst = class_burst
+        self._user_buckets: Dict[str, TokenBucket] = {}
+        self._class_buckets: Dict[str, TokenBucket] = {}
+        self._buckets_swept_at = time.monotonic()
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_saturated = 0
+        self._avg_hold_seconds = 5.0
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float, burst: int) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _estimated_wait(self) -> float:
+        return self._avg_hold_seconds * (self.queued + 1) / max(1, self.max_concurrency)
+
+    def _sweep_idle_buckets(self):
+        """Membuang bucket yang sudah penuh kembali; bucket baru dibuat lagi saat dibutuhkan."""
+        now = time.monotonic()
+        if now - self._buckets_swept_at < _BUCKET_SWEEP_INTERVAL_SECONDS:
+            return
+        self._buckets_swept_at = now
+        for buckets in (self._user_buckets, self._class_buckets):
+            for key in [key for key, bucket in buckets.items() if bucket.is_idle(now)]:
+                del buckets[key]
+
+    def check(self, user_id: str, class_id: str):
+        """Menerapkan batas laju per pengguna dan per kelas; raise AdmissionRejected bila terlampaui.
+
+        Token hanya diambil bila semua pemeriksaan lolos, sehingga permintaan yang
+        ditolak tidak mengurangi kuota pengguna maupun kelas.
+        """
+        self._sweep_idle_buckets()
+        user_bucket = self._bucket(self._user_buckets, str(user_id), self.user_rate, self.user_burst)
+        class_bucket = self._bucket(self._class_buckets, str(class_id), self.class_rate, self.class_burst)
+        user_wait = user_bucket.wait_time()
+        if user_wait:
+            self.rejected_rate_limited += 1
+            raise AdmissionRejected("Terlalu banyak permintaan AI dari pengguna ini.", user_wait)
+        class_wait = class_bucket.wait_time()
+        if class_wait:
+            self.rejected_rate_limited += 1
+            raise AdmissionRejected("Terlalu banyak permintaan AI dari kelas ini.", class_wait)
+        if self.queued >= self.max_queue_size:
+            self.rejected_saturated += 1
+            raise AdmissionRejected("Layanan AI sedang sibuk.", self._estimated_wait())
+        user_bucket.take()
+        class_bucket.take()
+
+    @asynccontextmanager
+    async def slot(self, class_id: str, priority: int = PRIORITY_STUDENT):
+        """Menahan satu slot pemanggilan hulu selama blok berjalan."""
+        await self._acquire(str(class_id), priority)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started_at
+            self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held
+            self._release()
+
+    async def _acquire(self, class_id: str, priority: int):
+        if self.active < self.max_concurrency and self.queued == 0:
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.queued >= self.max_queue_size:
+            self.rejected_saturated += 1
+            raise AdmissionRejected("Layanan AI sedang sibuk.", self._estimated_wait())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(priority, OrderedDict()).setdefault(class_id, deque()).append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait_seconds)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot sudah diberikan tepat sebelum batas waktu; kembalikan ke antrean
+                self._release()
+            else:
+                self._remove_waiter(priority, class_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_saturated += 1
+                raise AdmissionRejected("Layanan AI sedang sibuk.", self._estimated_wait())
+            raise
+        self.admitted += 1
+
+    def _remove_waiter(self, priority: int, class_id: str, waiter: asyncio.Future):
+        class_queues = self._queues.get(priority, {})
+        waiters = class_queues.get(class_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del class_queues[class_id]
+
+    def _release(self):
+        # Slot diteruskan langsung ke penunggu berikutnya (prioritas, lalu giliran antar kelas)
+        for priority in sorted(self._queues):
+            class_queues = self._queues[priority]
+            while class_queues:
+                class_id, waiters = next(iter(class_queues.items()))
+                waiter = waiters.popleft()
+                self.queued -= 1
+                if waiters:
+                    class_queues.move_to_end(class_id)
+                else:
+                    del class_queues[class_id]
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        depth_by_class: Dict[str, int] = {}
+        for class_queues in self._queues.values():
+            for class_id, waiters in class_queues.items():
+                depth_by_class[class_id] = depth_by_class.get(class_id, 0) + len(waiters)
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queued,
+            "queue_depth_by_class": depth_by_class,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_saturated": self.rejected_saturated,
+            "user_buckets": len(self._user_buckets),
+            "class_buckets": len(self._class_buckets),
+        }
+
+
+ai_admission = AdmissionController(
+    max_concurrency=settings.ai_max_concurrent_calls,
+    max_queue_size=settings.ai_max_queue_size,
+    max_wait_seconds=settings.ai_max_queue_wait_seconds,
+    user_rate_per_minute=settings.ai_user_rate_per_minute,
+    user_burst=settings.ai_user_burst,
+    class_rate_per_minute=settings.ai_class_rate_per_minute,
+    class_burst=settings.ai_class_burst,
+)
@@ -0,0 +1,119 @@
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ..config import settings
+from .text import normalize_text
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    embedding: Optional[List[float]]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class AnswerCache:
+    """Cache jawaban AI per kelas.
+
+    Pencarian dilakukan dua tahap: teks pertanyaan yang dinormalisasi (exact),
+    lalu kemiripan kosinus embedding pertanyaan di atas ambang batas. Entri
+    kedaluwarsa setelah TTL, dibuang secara LRU saat kelas penuh, dan seluruh
+    entri kelas dihapus saat materi atau definisinya berubah.
+    """
+
+    def __init__(self, max_entries_per_class: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries_per_class = max_entries_per_class
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: Dict[str, "OrderedDict[str, CachedAnswer]"] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _is_expired(self, entry: CachedAnswer) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def get(self, class_id: str, question: str) -> Optional[str]:
+        """Mencari jawaban berdasarkan teks pertanyaan yang dinormalisasi."""
+        entries = self._entries.get(str(class_id))
+        key = normalize_text(question)
+        entry = entries.get(key) if entries else None
+        if entry is None:
+            return None
+        if self._is_expired(entry):
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        self.exact_hits += 1
+        return entry.answer
+
+    def get_similar(self, class_id: str, embedding: List[float]) -> Optional[str]:
+        """Mencari jawaban untuk pertanyaan yang embedding-nya cukup mirip."""
+        entries = self._entries.get(str(class_id))
+        if not entries or not embedding:
+            self.misses += 1
+            return None
+        query = _unit(embedding)
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in list(entries.items()):
+            if self._is_expired(entry):
+                del entries[key]
+                continue
+            if entry.embedding is None:
+                continue
+            score = sum(a * b for a, b in zip(query, entry.embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            self.misses += 1
+            return None
+        entries.move_to_end(best_key)
+        self.semantic_hits += 1
+        return entries[best_key].answer
+
+    def put(self, class_id: str, question: str, answer: str, embedding: Optional[List[float]] = None):
+        entries = self._entries.setdefault(str(class_id), OrderedDict())
+        key = normalize_text(question)
+        entries[key] = CachedAnswer(answer=answer, embedding=_unit(embedding) if embedding else None)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries_per_class:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, class_id: Optional[str] = None):
+        """Menghapus cache satu kelas, atau seluruh kelas jika class_id None (definisi global)."""
+        self.invalidations += 1
+        if class_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(str(class_id), None)
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "classes": len(self._entries),
+            "entries": sum(len(e) for e in self._entries.values()),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries_per_class=settings.answer_cache_max_entries_per_class,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+    similarity_threshold=settings.answer_cache_similarity_threshold,
+)
@@ -0,0 +1,195 @@
+import asyncio
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+from supabase import Client
+
+from ..config import settings
+from ..dependencies import get_supabase_admin
+
+CHECKPOINT_CONFLICT_COLUMNS = "user_id,quiz_id,question_id,attempt_number"
+
+CheckpointKey = Tuple[str, str, str, int] # (user_id, quiz_id, question_id, attempt_number)
+
+
+def checkpoint_key(row: dict) -> CheckpointKey:
+    return (row["user_id"], row["quiz_id"], row["question_id"], row["attempt_number"])
+
+
+class CheckpointBufferFull(Exception):
+    """Buffer mencapai batas keras karena penulisan terus gagal; router memetakannya ke HTTP 503."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Checkpoints cannot be accepted right now.")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CheckpointBuffer:
+    """Buffer write-behind untuk checkpoint jawaban kuis.
+
+    Setiap perubahan jawaban langsung di-ack dan hanya jawaban terakhir per
+    (user, kuis, soal, attempt) yang disimpan. Buffer ditulis ke
+    quiz_checkpoints dengan upsert multi-baris setiap flush_interval detik,
+    atau lebih cepat bila antrean mencapai max_pending. Flush dijalankan
+    satu per satu sehingga flush sebelum submit juga menunggu flush yang
+    sedang berjalan.
+
+    Paling banyak satu flush latar yang berjalan. Setelah flush gagal, percobaan
+    berikutnya ditunda dengan jeda yang berlipat hingga max_backoff, dan add()
+    menolak checkpoint baru bila buffer melewati max_rows.
+
+    Buffer hanya ada di memori proses ini: submit di worker lain tidak melihat
+    checkpoint yang masih tertunda di sini, sehingga backend harus berjalan
+    dengan satu worker.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Client],
+        flush_interval_seconds: float,
+        max_pending: int,
+        page_size: int,
+        max_rows: int,
+        max_backoff_seconds: float,
+    ):
+        self.client_factory = client_factory
+        self.flush_interval = flush_interval_seconds
+        self.max_pending = max_pending
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.max_backoff = max_backoff_seconds
+        self._client: Optional[Client] = None
+        self._pending: Dict[CheckpointKey, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Referensi ke task flush latar; event loop hanya menyimpan weak reference
+        self._flush_task: Optional[asyncio.Task] = None
+        self._consecutive_failures = 0
+        self.received = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.write_requests = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+
+    def _retry_delay(self) -> float:
+        if not self._consecutive_failures:
+            return self.flush_interval
+        return min(self.max_backoff, self.flush_interval * 2 ** self._consecutive_failures)
+
+    def _arm_timer(self, delay: float):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(delay, self._schedule_flush)
+
+    def add(self, rows: List[dict]):
+        """Menampung baris checkpoint; baris lama untuk kunci yang sama ditimpa.
+
+        Raise CheckpointBufferFull bila baris baru membuat buffer melewati max_rows.
+        """
+        new_keys = {checkpoint_key(row) for row in rows} - self._pending.keys()
+        if len(self._pending) + len(new_keys) > self.max_rows:
+            self.rejected += len(rows)
+            raise CheckpointBufferFull(self._retry_delay())
+        for row in rows:
+            key = checkpoint_key(row)
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = row
+        self.received += len(rows)
+
+        # Selama backoff, flush berikutnya menunggu timer meskipun antrean penuh
+        if len(self._pending) >= self.max_pending and not self._consecutive_failures:
+            self._schedule_flush()
+        else:
+            self._arm_timer(self.flush_interval)
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None and not self._flush_task.done():
+            # Baris yang masuk selama flush ini ditulis oleh flush berikutnya
+            self._arm_timer(self.flush_interval)
+            return
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    def _upsert(self, rows: List[dict]):
+        if self._client is None:
+            self._client = self.client_factory()
+        for start in range(0, len(rows), self.page_size):
+            self._client.table("quiz_checkpoints").upsert(
+                rows[start:start + self.page_size],
+                on_conflict=CHECKPOINT_CONFLICT_COLUMNS,
+            ).execute()
+            self.write_requests += 1
+
+    def _matching_keys(self, user_id: str, quiz_id: str, attempt_number: Optional[int]) -> List[CheckpointKey]:
+        return [
+            key for key in self._pending
+            if key[0] == str(user_id) and key[1] == str(quiz_id) and attempt_number in (None, key[3])
+        ]
+
+    def discard(self, user_id: str, quiz_id: str, attempt_number: Optional[int] = None) -> int:
+        """Membuang checkpoint tertunda milik satu attempt yang sudah di-submit."""
+        keys = self._matching_keys(user_id, quiz_id, attempt_number)
+        for key in keys:
+            del self._pending[key]
+        return len(keys)
+
+    async def flush(self, user_id: Optional[str] = None, quiz_id: Optional[str] = None, attempt_number: Optional[int] = None) -> bool:
+        """Menulis checkpoint yang tertunda; dengan filter hanya milik satu user/kuis (dan attempt bila diberikan).
+
+        Mengembalikan False bila penulisan gagal (baris tetap di buffer untuk dicoba lagi).
+        """
+        async with self._flush_lock:
+            if user_id is None:
+                keys = list(self._pending)
+            else:
+                keys = self._matching_keys(user_id, quiz_id, attempt_number)
+            if not keys:
+                return True
+            rows = [self._pending.pop(key) for key in keys]
+            self.flushes += 1
+            try:
+                await asyncio.to_thread(self._upsert, rows)
+                self.rows_written += len(rows)
+                self._consecutive_failures = 0
+                return True
+            except Exception as e:
+                self.failed_flushes += 1
+                self._consecutive_failures += 1
+                print(f"Error flushing {len(rows)} quiz checkpoints: {e}")
+                # Kembalikan ke buffer kecuali sudah ada jawaban yang lebih baru
+                for row in rows:
+                    self._pending.setdefault(checkpoint_key(row), row)
+                # Timer yang sudah terpasang dengan jeda normal diganti jeda backoff
+                if self._flush_handle is not None:
+                    self._flush_handle.cancel()
+                    self._flush_handle = None
+                self._arm_timer(self._retry_delay())
+                return False
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "write_requests": self.write_requests,
+            "write_reduction": 1 - self.write_requests / self.received if self.received else 0.0,
+            "failed_flushes": self.failed_flushes,
+            "consecutive_failures": self._consecutive_failures,
+            "rejected": self.rejected,
+        }
+
+
+checkpoint_buffer = CheckpointBuffer(
+    client_factory=get_supabase_admin,
+    flush_interval_seconds=settings.checkpoint_flush_interval_seconds,
+    max_pending=settings.checkpoint_flush_max_pending,
+    page_size=settings.checkpoint_flush_page_size,
+    max_rows=settings.checkpoint_buffer_max_rows,
+    max_backoff_seconds=settings.checkpoint_flush_max_backoff_seconds,
+)
@@ -0,0 +1,131 @@
+import math
+from dataclasses import dataclass
+from typing import Hashable, List, Optional, Tuple
+
+from ..config import settings
+from .text import normalize_text
+
+# Perkiraan kasar tokenizer Gemini untuk teks Indonesia/Inggris
+CHARS_PER_TOKEN = 4
+# Overlap chunk_text() default; sambungan yang lebih pendek dianggap kebetulan
+MAX_CHUNK_OVERLAP = 200
+MIN_CHUNK_OVERLAP = 20
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def merge_overlapping(left: str, right: str, max_overlap: int = MAX_CHUNK_OVERLAP) -> str:
+    """Menyambung dua chunk bertetangga tanpa mengulang teks overlap di antaranya."""
+    for size in range(min(len(left), len(right), max_overlap), MIN_CHUNK_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}\n{right}"
+
+
+@dataclass
+class _Segment:
+    rank: int
+    material_id: str
+    first_index: int
+    last_index: int
+    text: str
+    best_chunk: str
+
+
+@dataclass
+class PackedContext:
+    chunks: List[str]
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class ContextPacker:
+    """Menyusun konteks prompt RAG dalam batas token.
+
+    Chunk materi yang bertetangga (chunk_index berurutan) disambung tanpa
+    overlap, duplikat dibuang, lalu segmen dimasukkan menurut relevansi
+    sampai anggaran token habis.
+    """
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def _segments(self, ranked: List[Tuple[Hashable, str]]) -> List[_Segment]:
+        segments: List[_Segment] = []
+        positioned = []
+        for rank, (key, text) in enumerate(ranked):
+            material_id, chunk_index = key
+            if isinstance(chunk_index, int):
+                positioned.append((material_id, chunk_index, rank, text))
+            else:
+                segments.append(_Segment(rank, material_id, -1, -1, text, text))
+
+        current: Optional[_Segment] = None
+        for material_id, chunk_index, rank, text in sorted(positioned):
+            if current and current.material_id == material_id and chunk_index == current.last_index + 1:
+                current.text = merge_overlapping(current.text, text)
+                current.last_index = chunk_index
+                if rank < current.rank:
+                    current.rank, current.best_chunk = rank, text
+                continue
+            current = _Segment(rank, material_id, chunk_index, chunk_index, text, text)
+            segments.append(current)
+        return sorted(segments, key=lambda segment: segment.rank)
+
+    def pack(self, ranked_chunks: List[Tuple[Hashable, str]], extra_chunks: Optional[List[str]] = None) -> PackedContext:
+        """Memadatkan konteks.
+
+        ranked_chunks: (kunci, teks) chunk materi urut relevansi, dengan kunci
+        (material_id, chunk_index) atau kunci lain untuk chunk tanpa posisi.
+        extra_chunks: teks tambahan (mis. definisi umum) yang relevansinya di
+        bawah chunk materi.
+        """
+        extra_chunks = extra_chunks or []
+        original = [text for _, text in ranked_chunks] + extra_chunks
+        tokens_before = sum(estimate_tokens(text) for text in original)
+
+        candidates = [(segment.text, segment.best_chunk) for segment in self._segments(ranked_chunks)]
+        candidates += [(text, text) for text in extra_chunks]
+
+        packed: List[str] = []
+        seen: List[str] = []
+        used = 0
+        for text, fallback in candidates:
+            for option in (text, fallback):
+                normalized = normalize_text(option)
+                if any(normalized in other for other in seen):
+                    break
+                cost = estimate_tokens(option)
+                if used + cost <= self.token_budget:
+                    packed.append(option)
+                    seen.append(normalized)
+                    used += cost
+                    break
+
+        result = PackedContext(packed, tokens_before, used)
+        self.requests += 1
+        self.tokens_before += result.tokens_before
+        self.tokens_after += result.tokens_after
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "requests": self.requests,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "avg_tokens_saved": (self.tokens_before - self.tokens_after) / self.requests if self.requests else 0.0,
+        }
+
+
+context_packer = ContextPacker(token_budget=settings.rag_context_token_budget)
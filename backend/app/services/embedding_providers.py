@@ -0,0 +1,139 @@
+import hashlib
+import math
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import google.generativeai as genai
+
+from ..config import settings
+from .text import normalize_text, tokenize
+
+TASK_QUERY = "retrieval_query"
+TASK_DOCUMENT = "retrieval_document"
+
+
+class EmbeddingProvider(ABC):
+    """Antarmuka penyedia embedding. embed() bersifat sinkron; pemanggil async memakai asyncio.to_thread."""
+
+    name = "base"
+
+    @abstractmethod
+    def embed(self, texts: List[str], task_type: str = TASK_DOCUMENT) -> List[List[float]]:
+        ...
+
+    def output_dimensions(self) -> int:
+        """Panjang vektor keluaran model, diukur dengan menyematkan satu teks contoh."""
+        return len(self.embed(["dimensi"], TASK_DOCUMENT)[0])
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    name = "gemini"
+
+    def __init__(self, model: str):
+        self.model = model
+        try:
+            genai.configure(api_key=settings.gemini_api_key)
+        except Exception as e:
+            print(f"Tidak dapat mengkonfigurasi Gemini API key: {e}")
+
+    def embed(self, texts: List[str], task_type: str = TASK_DOCUMENT) -> List[List[float]]:
+        if not texts:
+            return []
+        result = genai.embed_content(model=self.model, content=texts, task_type=task_type)
+        return result['embedding']
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Embedding lokal deterministik (feature hashing) tanpa panggilan jaringan.
+
+    Kata dasar (setelah stemming) dan trigram karakter di-hash ke vektor
+    berdimensi tetap lalu dinormalisasi. Kualitas semantiknya jauh di bawah
+    model sungguhan, tetapi cukup untuk tes, benchmark offline, dan pencocokan
+    kata kunci sederhana.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def _add(self, vector: List[float], feature: str, weight: float):
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        sign = 1.0 if digest & 1 else -1.0
+        vector[(digest >> 1) % self.dimensions] += sign * weight
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            self._add(vector, f"w:{token}", 1.0)
+        normalized = normalize_text(text)
+        for i in range(len(normalized) - 2):
+            self._add(vector, f"c:{normalized[i:i + 3]}", 0.5)
+        norm = math.sqrt(sum(value * value for value in vector))
+        if not norm:
+            # Vektor nol membuat jarak kosinus tidak terdefinisi
+            vector[0] = 1.0
+            return vector
+        return [value / norm for value in vector]
+
+    def embed(self, texts: List[str], task_type: str = TASK_DOCUMENT) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def output_dimensions(self) -> int:
+        return self.dimensions
+
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """Model sentence-embedding kecil (mis. ekspor ONNX multilingual MiniLM) yang dijalankan di CPU.
+
+    Membutuhkan paket opsional onnxruntime dan tokenizers.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, tokenizer_path: str, max_length: int = 256):
+        try:
+            import numpy as np
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError("The onnx embedding provider requires the onnxruntime and tokenizers packages.") from e
+        self._np = np
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    def embed(self, texts: List[str], task_type: str = TASK_DOCUMENT) -> List[List[float]]:
+        if not texts:
+            return []
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling atas token non-padding, lalu normalisasi L2
+        mask = attention_mask[..., None].astype(token_embeddings.dtype)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+def get_embedding_provider(name: Optional[str] = None, model: Optional[str] = None) -> EmbeddingProvider:
+    """Membuat penyedia embedding sesuai settings.embedding_provider (atau nama yang diberikan)."""
+    name = (name or settings.embedding_provider).lower()
+    if name == "gemini":
+        return GeminiEmbeddingProvider(model or settings.embedding_model)
+    if name == "hashing":
+        return HashingEmbeddingProvider(settings.embedding_dimensions)
+    if name == "onnx":
+        return OnnxEmbeddingProvider(model or settings.onnx_model_path, settings.onnx_tokenizer_path)
+    raise ValueError(f"Unknown embedding provider '{name}'. Use gemini, hashing or onnx.")
+
+
+embedding_provider = get_embedding_provider()
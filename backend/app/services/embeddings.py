@@ -0,0 +1,120 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from ..config import settings
+from .embedding_providers import EmbeddingProvider, TASK_DOCUMENT, TASK_QUERY, embedding_provider
+from .text import normalize_text
+
+
+class EmbeddingService:
+    """Embedding pertanyaan dengan cache LRU dan micro-batching.
+
+    Pertanyaan yang pernah di-embed (setelah normalisasi) diambil dari cache.
+    Cache miss yang datang bersamaan dalam jendela beberapa milidetik digabung
+    menjadi satu panggilan ke penyedia embedding berisi banyak teks.
+    """
+
+    def __init__(self, provider: EmbeddingProvider, cache_size: int, batch_window_ms: float, max_batch_size: int):
+        self.provider = provider
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._batch: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Referensi ke task flush yang berjalan; event loop hanya menyimpan weak reference
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._generation = 0 # Naik setiap penyedia diganti; hasil flush model lama tidak di-cache
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_texts = 0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.provider.embed(texts, TASK_QUERY)
+
+    def use_provider(self, provider: EmbeddingProvider):
+        """Mengganti penyedia (setelah migrasi model) dan membuang embedding model lama dari cache."""
+        self.provider = provider
+        self._generation += 1
+        self._cache.clear()
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._cache[key] = embedding
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def embed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return embedding
+        self.misses += 1
+
+        # Pertanyaan yang sama di batch yang sedang menunggu berbagi satu hasil
+        future = self._batch.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._batch[key] = future
+            if len(self._batch) >= self.max_batch_size:
+                self._schedule_flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._schedule_flush)
+        return await asyncio.shield(future)
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, {}
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: Dict[str, asyncio.Future]):
+        texts = list(batch)
+        generation = self._generation
+        self.batches += 1
+        self.batched_texts += len(texts)
+        try:
+            embeddings = await asyncio.to_thread(self._embed_batch, texts)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, embedding in zip(texts, embeddings):
+            if generation == self._generation:
+                self._remember(text, embedding)
+            if not batch[text].done():
+                batch[text].set_result(embedding)
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embedding dokumen (tanpa cache) dalam satu panggilan, di luar event loop."""
+        return await asyncio.to_thread(self.provider.embed, texts, TASK_DOCUMENT)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "provider": self.provider.name,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+        }
+
+
+embedding_service = EmbeddingService(
+    provider=embedding_provider,
+    cache_size=settings.query_embedding_cache_size,
+    batch_window_ms=settings.query_embedding_batch_window_ms,
+    max_batch_size=settings.query_embedding_max_batch_size,
+)
@@ -0,0 +1,81 @@
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from supabase import Client
+
+# Naikkan bila logika ekstraksi (unstructured/OCR) berubah agar hasil lama tidak dipakai lagi
+EXTRACTOR_VERSION = 2
+
+
+def content_hash(file_content: bytes) -> str:
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def normalize_extracted_text(text: str) -> str:
+    """Merapikan teks hasil ekstraksi tanpa mengubah isinya (NFC, spasi akhir baris, baris kosong beruntun)."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\x00", "")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+@dataclass
+class ExtractionResult:
+    text: str
+    elements: List[Dict[str, Any]] = field(default_factory=list) # [{type, text, page}]
+
+
+class ExtractionCache:
+    """Cache hasil ekstraksi teks materi di tabel material_extractions, per hash isi file."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sb: Client, file_hash: str) -> Optional[ExtractionResult]:
+        try:
+            res = sb.table("material_extractions").select("text, elements")\
+                .eq("content_hash", file_hash)\
+                .eq("extractor_version", EXTRACTOR_VERSION)\
+                .limit(1).execute()
+        except Exception as e:
+            print(f"Error membaca cache ekstraksi {file_hash}: {e}")
+            res = None
+        if res and res.data:
+            self.hits += 1
+            return ExtractionResult(res.data[0]["text"], res.data[0]["elements"] or [])
+        self.misses += 1
+        return None
+
+    def get_for_material(self, sb: Client, material_id: str) -> Optional[ExtractionResult]:
+        """Hasil ekstraksi materi berdasarkan materials.content_hash, jika sudah pernah diproses."""
+        res = sb.table("materials").select("content_hash").eq("id", material_id).limit(1).execute()
+        if not res.data or not res.data[0].get("content_hash"):
+            return None
+        return self.get(sb, res.data[0]["content_hash"])
+
+    def put(self, sb: Client, file_hash: str, mime_type: str, result: ExtractionResult):
+        try:
+            sb.table("material_extractions").upsert({
+                "content_hash": file_hash,
+                "extractor_version": EXTRACTOR_VERSION,
+                "mime_type": mime_type,
+                "text": result.text,
+                "elements": result.elements,
+            }).execute()
+        except Exception as e:
+            # Cache bersifat best-effort; pipeline tetap berjalan
+            print(f"Error menyimpan cache ekstraksi {file_hash}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+AUTO_GRADED_TYPES = ("mcq", "true_false")
+TRUE_FALSE_OPTIONS = ("True", "False", "true", "false")
+
+
+def normalize_answer(answer) -> str:
+    """Bentuk pembanding jawaban MCQ/true-false."""
+    return str(answer).strip().lower()
+
+
+class KeyEntry(NamedTuple):
+    question_type: str
+    answer: Optional[str] # Sudah dinormalisasi; None bila tidak dinilai otomatis (esai)
+    points: int # Nilai maksimum soal (dijumlahkan ke total)
+    verdicts: Dict[str, bool] # Teks pilihan persis seperti dikirim siswa -> benar/salah
+
+
+@dataclass
+class GradedSubmission:
+    score: int
+    total: int
+    # Tuple biasa (bukan objek) agar penilaian massal tetap murah
+    answers: List[Tuple[str, object, bool]] = field(default_factory=list) # (question_id, answer, is_correct) MCQ/true-false
+    essays: List[Tuple[str, object]] = field(default_factory=list) # (question_id, answer)
+
+    @property
+    def status(self) -> str:
+        return "pending_review" if self.essays else "completed"
+
+
+class AnswerKey:
+    """Kunci jawaban kuis yang dikompilasi sekali untuk penilaian cepat.
+
+    Jawaban benar dinormalisasi saat kompilasi, dan setiap pilihan jawaban
+    (options MCQ, True/False) sudah dinilai sebelumnya. Jawaban siswa yang sama
+    persis dengan salah satu pilihan cukup satu lookup dict; hanya jawaban lain
+    yang dinormalisasi saat penilaian.
+    Skor = jumlah poin (max_score) soal yang benar; total = poin semua soal
+    yang dijawab, termasuk esai yang dinilai guru kemudian.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, KeyEntry]] = None):
+        self.entries = entries or {}
+
+    @classmethod
+    def compile(cls, questions: List[dict]) -> "AnswerKey":
+        entries = {}
+        for question in questions:
+            question_type = question.get("type")
+            max_score = question.get("max_score")
+            if question_type in AUTO_GRADED_TYPES:
+                correct_answer = normalize_answer(question.get("answer"))
+                options = question.get("options") or ()
+                if question_type == "true_false":
+                    options = [*options, *TRUE_FALSE_OPTIONS]
+                verdicts = {option: normalize_answer(option) == correct_answer for option in options if isinstance(option, str)}
+                entry = KeyEntry(question_type, correct_answer, 1 if max_score is None else max_score, verdicts)
+            else:
+                entry = KeyEntry(question_type, None, max_score or 0, {})
+            entries[str(question["id"]).lower()] = entry
+        return cls(entries)
+
+    def __contains__(self, question_id) -> bool:
+        return str(question_id).lower() in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def grade(self, user_answers: dict) -> GradedSubmission:
+        """Menilai satu submission {question_id: answer}; soal yang tidak dikenal diabaikan."""
+        entries = self.entries
+        score = total = 0
+        answers, essays = [], []
+        for question_id, answer in user_answers.items():
+            entry = entries.get(question_id)
+            if entry is None:
+                # Id berupa UUID atau dengan huruf besar
+                question_id = str(question_id).lower()
+                entry = entries.get(question_id)
+                if entry is None:
+                    continue
+            question_type, correct_answer, points, verdicts = entry
+            if correct_answer is None:
+                if question_type == "essay":
+                    total += points
+                    essays.append((question_id, answer))
+                continue # Jenis soal lain tidak dinilai otomatis
+            total += points
+            is_correct = verdicts.get(answer) if answer.__class__ is str else None
+            if is_correct is None:
+                is_correct = str(answer).strip().lower() == correct_answer
+            if is_correct:
+                score += points
+            answers.append((question_id, answer, is_correct))
+        return GradedSubmission(score, total, answers, essays)
+
+    def grade_many(self, submissions: Iterable[dict]) -> List[GradedSubmission]:
+        """Menilai banyak submission sekaligus (regrade) dengan kunci yang sama."""
+        grade = self.grade
+        return [grade(user_answers) for user_answers in submissions]
@@ -0,0 +1,120 @@
+import asyncio
+import io
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Tuple
+
+from pypdf import PdfReader
+
+from ..config import settings
+
+_MB = 1024 * 1024
+# Ukuran halaman A4 dalam inci
+_PAGE_WIDTH_IN, _PAGE_HEIGHT_IN = 8.27, 11.69
+
+
+def estimate_ingestion_bytes(file_content: Optional[bytes], mime_type: Optional[str]) -> int:
+    """Perkiraan puncak memori satu run process_material_for_rag.
+
+    Mencakup salinan byte file dan hasil ekstraksinya, serta (untuk PDF) seluruh
+    halaman yang dirasterisasi untuk OCR: pdf2image menahan semua halaman
+    sekaligus, ditambah satu salinan kerja per halaman saat diproses.
+    """
+    if file_content is None:
+        return settings.ingestion_default_job_mb * _MB
+    estimate = settings.ingestion_base_job_mb * _MB + 4 * len(file_content)
+    if mime_type == "application/pdf":
+        try:
+            pages = len(PdfReader(io.BytesIO(file_content)).pages)
+        except Exception:
+            pages = max(1, len(file_content) // (100 * 1024))
+        channels = 3 if settings.ocr_color_mode == "color" else 1
+        page_bytes = int(_PAGE_WIDTH_IN * settings.ocr_dpi * _PAGE_HEIGHT_IN * settings.ocr_dpi * channels)
+        estimate += (pages + 1) * page_bytes
+    return estimate
+
+
+class IngestionAdmission:
+    """Batas global jumlah run ingestion bersamaan dan total perkiraan memorinya.
+
+    Run yang tidak muat menunggu di antrean FIFO (tidak ditolak). Run yang
+    perkiraannya melebihi seluruh anggaran tetap dijalankan, tetapi hanya saat
+    tidak ada run lain yang aktif.
+    """
+
+    def __init__(self, max_concurrency: int, memory_budget_bytes: int):
+        self.max_concurrency = max_concurrency
+        self.memory_budget_bytes = memory_budget_bytes
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.active = 0
+        self.reserved_bytes = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.max_wait_seconds = 0.0
+
+    def _fits(self, size: int) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        return self.active == 0 or self.reserved_bytes + size <= self.memory_budget_bytes
+
+    def _grant(self, size: int):
+        self.active += 1
+        self.reserved_bytes += size
+        self.admitted += 1
+
+    def _release(self, size: int):
+        self.active -= 1
+        self.reserved_bytes -= size
+        # Berikan slot ke antrean terdepan selama muat (FIFO agar run besar tidak kelaparan)
+        while self._waiters and self._fits(self._waiters[0][0]):
+            next_size, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._grant(next_size)
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, estimated_bytes: int):
+        """Menahan slot dan anggaran memori selama blok berjalan; menunggu di antrean bila perlu."""
+        size = max(0, int(estimated_bytes))
+        if not self._waiters and self._fits(size):
+            self._grant(size)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append((size, waiter))
+            self.queued_total += 1
+            queued_at = time.monotonic()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(size)
+                else:
+                    self._waiters = deque(item for item in self._waiters if item[1] is not waiter)
+                raise
+            self.max_wait_seconds = max(self.max_wait_seconds, time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": len(self._waiters),
+            "queued_bytes": sum(size for size, _ in self._waiters),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "memory_reserved_bytes": self.reserved_bytes,
+            "memory_utilization": self.reserved_bytes / self.memory_budget_bytes if self.memory_budget_bytes else 0.0,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "max_wait_seconds": round(self.max_wait_seconds, 2),
+        }
+
+
+ingestion_admission = IngestionAdmission(
+    max_concurrency=settings.ingestion_max_concurrency,
+    memory_budget_bytes=settings.ingestion_memory_budget_mb * _MB,
+)
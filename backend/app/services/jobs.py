@@ -0,0 +1,107 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Job yang sudah selesai disimpan sebentar agar hasilnya masih bisa diambil
+_FINISHED_JOB_TTL_SECONDS = 3600
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    owner_id: str
+    total: int
+    status: str = "pending" # pending, running, completed, failed
+    completed: int = 0
+    failed: int = 0
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    version: int = 0
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "results": self.results,
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """Registri job latar belakang di memori proses, dengan notifikasi progres."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._changed = asyncio.Condition()
+
+    def create(self, kind: str, owner_id: str, total: int) -> Job:
+        self._prune()
+        job = Job(id=str(uuid.uuid4()), kind=kind, owner_id=str(owner_id), total=total)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(str(job_id))
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [
+            j.id for j in self._jobs.values()
+            if j.finished_at and now - j.finished_at > _FINISHED_JOB_TTL_SECONDS
+        ]:
+            del self._jobs[job_id]
+
+    async def update(self, job: Job, **changes):
+        """Memperbarui job dan membangunkan semua pengamat progres."""
+        for name, value in changes.items():
+            setattr(job, name, value)
+        if job.is_finished and job.finished_at is None:
+            job.finished_at = time.time()
+        job.version += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def record_result(self, job: Job, result: Dict[str, Any]):
+        job.results.append(result)
+        await self.update(job, completed=job.completed + 1)
+
+    async def record_error(self, job: Job, error: Dict[str, Any]):
+        job.errors.append(error)
+        await self.update(job, failed=job.failed + 1)
+
+    async def watch(self, job: Job) -> AsyncIterator[Dict[str, Any]]:
+        """Menghasilkan snapshot job setiap kali berubah, sampai job selesai."""
+        seen = -1
+        while True:
+            if job.version != seen:
+                seen = job.version
+                yield job.to_dict()
+                if job.is_finished:
+                    return
+            async with self._changed:
+                await self._changed.wait_for(lambda: job.version != seen)
+
+    def stats(self) -> Dict[str, Any]:
+        by_status: Dict[str, int] = {}
+        for job in self._jobs.values():
+            key = f"{job.kind}:{job.status}"
+            by_status[key] = by_status.get(key, 0) + 1
+        return by_status
+
+
+job_registry = JobRegistry()
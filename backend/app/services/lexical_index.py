@@ -0,0 +1,251 @@
+import asyncio
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from supabase import Client
+
+from ..config import settings
+from .singleflight import SingleFlight
+from .text import tokenize
+
+# Batas baris per permintaan PostgREST
+_PAGE_SIZE = 1000
+
+
+@dataclass
+class LexicalHit:
+    material_id: str
+    chunk_index: int
+    text: str
+    score: float
+    matched_terms: int
+
+
+class ClassLexicalIndex:
+    """Indeks terbalik BM25 untuk seluruh chunk materi dalam satu kelas."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self.doc_lengths: Dict[Tuple[str, int], int] = {}
+        self.doc_texts: Dict[Tuple[str, int], str] = {}
+        self.material_chunk_counts: Counter = Counter()
+        self.total_length = 0
+        # Isi class_materials saat indeks dimuat, untuk mendeteksi materi yang ditautkan/dilepas
+        self.class_material_ids: FrozenSet[str] = frozenset()
+        self.loaded_at = time.monotonic()
+
+    def add_chunk(self, material_id: str, chunk_index: int, text: str):
+        doc_id = (str(material_id), int(chunk_index))
+        if doc_id in self.doc_lengths:
+            self.remove_doc(doc_id)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_texts[doc_id] = text
+        self.material_chunk_counts[doc_id[0]] += 1
+        self.total_length += length
+
+    def remove_doc(self, doc_id: Tuple[str, int]):
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        text = self.doc_texts.pop(doc_id, "")
+        self.total_length -= length
+        self.material_chunk_counts[doc_id[0]] -= 1
+        if self.material_chunk_counts[doc_id[0]] <= 0:
+            del self.material_chunk_counts[doc_id[0]]
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs and doc_id in docs:
+                del docs[doc_id]
+                if not docs:
+                    del self.postings[term]
+
+    def remove_material(self, material_id: str):
+        if str(material_id) not in self.material_chunk_counts:
+            return
+        for doc_id in [d for d in self.doc_lengths if d[0] == str(material_id)]:
+            self.remove_doc(doc_id)
+
+    def material_ids(self) -> List[str]:
+        return list(self.material_chunk_counts)
+
+    def search(self, query: str, k: int) -> List[LexicalHit]:
+        query_terms = set(tokenize(query))
+        n_docs = len(self.doc_lengths)
+        if not query_terms or not n_docs:
+            return []
+        avg_length = self.total_length / n_docs or 1.0
+        scores: Dict[Tuple[str, int], float] = {}
+        matched: Dict[Tuple[str, int], int] = {}
+        for term in query_terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            LexicalHit(doc_id[0], doc_id[1], self.doc_texts[doc_id], score, matched[doc_id])
+            for doc_id, score in ranked
+        ]
+
+
+class LexicalIndexRegistry:
+    """Menyimpan indeks per kelas di memori proses.
+
+    Indeks dimuat dari tabel material_embeddings saat pertama kali kelas dicari,
+    lalu diperbarui secara inkremental oleh pipeline ingestion di proses ini.
+    Ingestion di worker lain tidak terlihat di sini, sehingga indeks dimuat ulang
+    bila daftar class_materials berubah atau umurnya melewati TTL.
+
+    Handler async memakai asearch(): pembacaan database berjalan di thread dan
+    pemuatan kelas yang sama secara bersamaan digabung menjadi satu.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._indexes: Dict[str, ClassLexicalIndex] = {}
+        self._load_flight = SingleFlight()
+        # Bertambah setiap kali indeks diubah langsung; pemuatan di thread yang mulai
+        # sebelum perubahan tidak disimpan agar perubahan itu tidak tertimpa
+        self._changes = 0
+        self.loads = 0
+
+    def _build_class(self, sb: Client, material_ids: List[str]) -> ClassLexicalIndex:
+        index = ClassLexicalIndex()
+        index.class_material_ids = frozenset(str(m) for m in material_ids)
+        if material_ids:
+            start = 0
+            while True:
+                rows = sb.table("material_embeddings").select("material_id, chunk_index, text")\
+                    .in_("material_id", material_ids)\
+                    .order("material_id")\
+                    .order("chunk_index")\
+                    .range(start, start + _PAGE_SIZE - 1)\
+                    .execute().data or []
+                for row in rows:
+                    index.add_chunk(row["material_id"], row["chunk_index"], row["text"])
+                if len(rows) < _PAGE_SIZE:
+                    break
+                start += _PAGE_SIZE
+        return index
+
+    def _load_class(self, sb: Client, class_id: str, material_ids: List[str]) -> ClassLexicalIndex:
+        index = self._build_class(sb, material_ids)
+        self._indexes[class_id] = index
+        self.loads += 1
+        return index
+
+    async def _aload_class(self, sb: Client, class_id: str, material_ids: List[str]) -> ClassLexicalIndex:
+        changes = self._changes
+        index = await asyncio.to_thread(self._build_class, sb, material_ids)
+        if changes == self._changes:
+            self._indexes[class_id] = index
+        self.loads += 1
+        return index
+
+    def _is_fresh(self, index: Optional[ClassLexicalIndex], material_ids: List[str]) -> bool:
+        return (
+            index is not None
+            and time.monotonic() - index.loaded_at <= self.ttl_seconds
+            and index.class_material_ids == frozenset(str(m) for m in material_ids)
+        )
+
+    def get(self, sb: Client, class_id: str, material_ids: Optional[List[str]] = None) -> ClassLexicalIndex:
+        """Indeks kelas; material_ids adalah isi class_materials terkini (dibaca bila None)."""
+        class_id = str(class_id)
+        if material_ids is None:
+            material_ids = class_material_ids(sb, class_id)
+        index = self._indexes.get(class_id)
+        if not self._is_fresh(index, material_ids):
+            index = self._load_class(sb, class_id, material_ids)
+        return index
+
+    async def aget(self, sb: Client, class_id: str, material_ids: Optional[List[str]] = None) -> ClassLexicalIndex:
+        """Versi async get() yang tidak memblokir event loop."""
+        class_id = str(class_id)
+        if material_ids is None:
+            material_ids = await asyncio.to_thread(class_material_ids, sb, class_id)
+        index = self._indexes.get(class_id)
+        if self._is_fresh(index, material_ids):
+            return index
+        key = (class_id, frozenset(str(m) for m in material_ids))
+        return await self._load_flight.do(key, lambda: self._aload_class(sb, class_id, material_ids))
+
+    def add_chunks(self, class_ids: Iterable[str], material_id: str, chunks: List[str]):
+        """Menambahkan chunk baru ke indeks kelas yang sudah dimuat.
+
+        Kelas yang belum dimuat akan membaca chunk ini dari database saat pertama dicari.
+        """
+        self._changes += 1
+        for class_id in class_ids:
+            index = self._indexes.get(str(class_id))
+            if index is None:
+                continue
+            index.remove_material(material_id)
+            for i, chunk in enumerate(chunks):
+                index.add_chunk(material_id, i, chunk)
+
+    def remove_material(self, material_id: str):
+        self._changes += 1
+        for index in self._indexes.values():
+            index.remove_material(material_id)
+
+    def invalidate(self, class_id: Optional[str] = None):
+        self._changes += 1
+        if class_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(str(class_id), None)
+
+    def search(self, sb: Client, class_id: str, query: str, k: Optional[int] = None, material_ids: Optional[List[str]] = None) -> List[LexicalHit]:
+        return self.get(sb, class_id, material_ids).search(query, k or settings.rag_top_k)
+
+    async def asearch(self, sb: Client, class_id: str, query: str, k: Optional[int] = None, material_ids: Optional[List[str]] = None) -> List[LexicalHit]:
+        index = await self.aget(sb, class_id, material_ids)
+        return index.search(query, k or settings.rag_top_k)
+
+    def stats(self) -> dict:
+        return {"classes": len(self._indexes), "loads": self.loads, "load_flight": self._load_flight.stats()}
+
+
+def class_material_ids(sb: Client, class_id: str) -> List[str]:
+    """Id materi yang ditautkan ke kelas (tabel class_materials)."""
+    materials_res = sb.table("class_materials").select("material_id").eq("class_id", str(class_id)).execute()
+    return [m["material_id"] for m in materials_res.data or []]
+
+
+def is_confident_lexical_match(query: str, hits: List[LexicalHit]) -> bool:
+    """True jika pertanyaan pendek dan seluruh katanya ditemukan pada chunk teratas.
+
+    Pertanyaan kata kunci seperti nama rumus atau istilah cukup dijawab dari
+    hasil leksikal, sehingga panggilan embedding bisa dilewati.
+    """
+    query_terms = set(tokenize(query))
+    if not hits or not query_terms or len(query_terms) > settings.lexical_only_max_terms:
+        return False
+    return hits[0].matched_terms >= len(query_terms)
+
+
+def reciprocal_rank_fusion(rankings: List[List], k: Optional[int] = None) -> List:
+    """Menggabungkan beberapa daftar peringkat (berisi kunci dokumen) dengan RRF."""
+    k = k or settings.rag_rrf_k
+    scores: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+lexical_index = LexicalIndexRegistry(ttl_seconds=settings.lexical_index_ttl_seconds)
@@ -0,0 +1,123 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from PIL import Image
+from supabase import Client
+
+from ..config import settings
+
+
+def page_hash(image: Image.Image, mode: str = "exact") -> str:
+    """Hash halaman hasil render.
+
+    exact: sha256 piksel (tidak bergantung pada encoder PNG).
+    perceptual: dHash 16x16, sehingga hasil scan yang hanya berbeda sedikit
+    (kompresi, noise) tetap cocok.
+    """
+    if mode == "perceptual":
+        gray = image.convert("L").resize((17, 16), Image.LANCZOS)
+        pixels = list(gray.getdata())
+        bits = 0
+        for row in range(16):
+            for col in range(16):
+                left, right = pixels[row * 17 + col], pixels[row * 17 + col + 1]
+                bits = (bits << 1) | (left > right)
+        return f"p:{bits:064x}"
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return f"e:{digest.hexdigest()}"
+
+
+class OcrPageCache:
+    """Cache teks OCR per halaman: LRU di memori di depan tabel ocr_page_cache.
+
+    Entri di tabel yang tidak dipakai lebih dari ttl_days dihapus secara
+    berkala (setiap prune_every penyimpanan baru).
+    """
+
+    def __init__(self, max_memory_entries: int, ttl_days: int, prune_every: int = 100):
+        self.max_memory_entries = max_memory_entries
+        self.ttl_days = ttl_days
+        self.prune_every = prune_every
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._puts_since_prune = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.db_evictions = 0
+
+    def _remember(self, key: str, text: str):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def get(self, sb: Client, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return text
+        try:
+            res = sb.table("ocr_page_cache").select("extracted_text, hit_count").eq("page_hash", key).limit(1).execute()
+        except Exception as e:
+            print(f"Error membaca cache OCR: {e}")
+            res = None
+        if res and res.data:
+            self.db_hits += 1
+            text = res.data[0]["extracted_text"]
+            self._remember(key, text)
+            try:
+                sb.table("ocr_page_cache").update({
+                    "hit_count": res.data[0]["hit_count"] + 1,
+                    "last_used_at": datetime.now(timezone.utc).isoformat(),
+                }).eq("page_hash", key).execute()
+            except Exception as e:
+                print(f"Error memperbarui cache OCR: {e}")
+            return text
+        self.misses += 1
+        return None
+
+    def put(self, sb: Client, key: str, text: str):
+        self._remember(key, text)
+        try:
+            sb.table("ocr_page_cache").upsert({"page_hash": key, "extracted_text": text}).execute()
+        except Exception as e:
+            # Cache bersifat best-effort; hasil OCR tetap dipakai
+            print(f"Error menyimpan cache OCR: {e}")
+            return
+        self._puts_since_prune += 1
+        if self._puts_since_prune >= self.prune_every:
+            self._puts_since_prune = 0
+            self.prune(sb)
+
+    def prune(self, sb: Client):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.ttl_days)).isoformat()
+        try:
+            res = sb.table("ocr_page_cache").delete().lt("last_used_at", cutoff).execute()
+            self.db_evictions += len(res.data or [])
+        except Exception as e:
+            print(f"Error memangkas cache OCR: {e}")
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_evictions": self.memory_evictions,
+            "db_evictions": self.db_evictions,
+        }
+
+
+ocr_page_cache = OcrPageCache(
+    max_memory_entries=settings.ocr_cache_memory_entries,
+    ttl_days=settings.ocr_cache_ttl_days,
+)
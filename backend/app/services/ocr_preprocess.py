@@ -0,0 +1,98 @@
+import io
+from dataclasses import dataclass
+from typing import Tuple
+
+from PIL import Image, ImageOps
+
+from ..config import settings
+
+_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@dataclass
+class OcrImageOptions:
+    dpi: int = 150
+    color_mode: str = "grayscale" # color, grayscale, binary
+    crop_margins: bool = True
+    max_dimension: int = 2000 # Longest side in pixels after cropping; 0 keeps the rendered size
+    image_format: str = "jpeg" # jpeg, webp, png
+    quality: int = 80 # jpeg/webp quality
+
+    @classmethod
+    def from_settings(cls) -> "OcrImageOptions":
+        return cls(
+            dpi=settings.ocr_dpi,
+            color_mode=settings.ocr_color_mode,
+            crop_margins=settings.ocr_crop_margins,
+            max_dimension=settings.ocr_max_dimension,
+            image_format=settings.ocr_image_format,
+            quality=settings.ocr_image_quality,
+        )
+
+
+def otsu_threshold(gray: Image.Image) -> int:
+    """Ambang binarisasi Otsu dari histogram citra grayscale."""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if not weight_background:
+            continue
+        weight_foreground = total - weight_background
+        if not weight_foreground:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def prepare_page(image: Image.Image, options: OcrImageOptions) -> Image.Image:
+    """Menyiapkan halaman hasil render untuk OCR: grayscale/binarisasi, potong margin, batasi ukuran."""
+    if options.color_mode != "color":
+        image = image.convert("L")
+
+    if options.crop_margins:
+        gray = image if image.mode == "L" else image.convert("L")
+        # Piksel yang jelas lebih gelap dari kertas dianggap konten
+        content = gray.point(lambda value: 255 if value < 200 else 0).getbbox()
+        if content:
+            padding = max(8, options.dpi // 10)
+            left, top, right, bottom = content
+            image = image.crop((
+                max(0, left - padding),
+                max(0, top - padding),
+                min(image.width, right + padding),
+                min(image.height, bottom + padding),
+            ))
+
+    if options.max_dimension and max(image.size) > options.max_dimension:
+        image = image.copy()
+        image.thumbnail((options.max_dimension, options.max_dimension), Image.LANCZOS)
+
+    if options.color_mode == "binary":
+        threshold = otsu_threshold(image)
+        image = image.point(lambda value: 255 if value > threshold else 0, mode="1")
+    return image
+
+
+def encode_page(image: Image.Image, options: OcrImageOptions) -> Tuple[bytes, str]:
+    """Meng-encode halaman ke format yang dikirim ke Edge Function OCR. Mengembalikan (bytes, mime_type)."""
+    image_format = options.image_format.lower()
+    if image_format not in _MIME_TYPES:
+        raise ValueError(f"Unsupported OCR image format '{options.image_format}'.")
+    buffer = io.BytesIO()
+    if image_format == "jpeg":
+        # JPEG tidak mendukung citra 1-bit
+        image.convert("L" if image.mode in ("1", "L") else "RGB").save(buffer, format="JPEG", quality=options.quality, optimize=True)
+    elif image_format == "webp":
+        image.convert("L" if image.mode == "1" else image.mode).save(buffer, format="WEBP", quality=options.quality, method=4)
+    else:
+        image.save(buffer, format="PNG", optimize=image.mode == "1")
+    return buffer.getvalue(), _MIME_TYPES[image_format]
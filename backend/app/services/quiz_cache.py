@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from supabase import Client
+
+from ..config import settings
+from .grading import AnswerKey
+
+
+@dataclass
+class QuizDefinition:
+    """Snapshot satu kuis: baris quizzes, daftar soal, visibilitas, dan kunci jawaban."""
+    quiz_id: str
+    version: int
+    quiz: dict # Baris quizzes termasuk classes(class_name)
+    questions: List[dict]
+    visible_to: List[str]
+    answer_key: AnswerKey = field(default_factory=AnswerKey)
+    loaded_at: float = field(default_factory=time.monotonic)
+    # Payload siswa (tanpa kunci jawaban) yang diserialisasi sekali oleh router kuis
+    student_payload: Optional[bytes] = None
+    student_etag: Optional[str] = None
+
+    @property
+    def class_id(self) -> str:
+        return self.quiz["class_id"]
+
+    @property
+    def weight(self) -> int:
+        return self.quiz.get("weight")
+
+
+class QuizDefinitionCache:
+    """Cache definisi kuis di memori proses, dikunci dengan quiz_id + versi.
+
+    Setiap invalidate() menaikkan versi kuis tersebut, sehingga entri lama dan
+    hasil load yang sedang berjalan saat kuis diubah tidak pernah dipakai lagi.
+    TTL membatasi umur entri agar perubahan dari worker lain tetap terlihat.
+
+    get() melakukan I/O sinkron dan bisa menunggu load kuis yang sama di thread
+    lain, jadi hanya untuk handler sinkron (threadpool). Handler async memakai
+    aget(), yang menjalankan load di thread tanpa memblokir event loop.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, QuizDefinition]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._load_locks: Dict[str, list] = {} # quiz_id -> [lock, jumlah thread yang memakainya]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+
+    def _lookup(self, key: str) -> Optional[QuizDefinition]:
+        with self._lock:
+            definition = self._entries.get(key)
+            if definition is None:
+                return None
+            expired = time.monotonic() - definition.loaded_at > self.ttl_seconds
+            if expired or definition.version != self._versions.get(key, 0):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return definition
+
+    def _load(self, sb: Client, key: str, version: int) -> Optional[QuizDefinition]:
+        quiz_res = sb.table("quizzes").select("*, classes(class_name)").eq("id", key).limit(1).execute()
+        if not quiz_res.data:
+            return None
+        questions_res = sb.table("questions").select("*").eq("quiz_id", key).execute()
+        visibility_res = sb.table("quiz_visibility").select("user_id").eq("quiz_id", key).execute()
+        questions = questions_res.data or []
+        return QuizDefinition(
+            quiz_id=key,
+            version=version,
+            quiz=quiz_res.data[0],
+            questions=questions,
+            visible_to=[item["user_id"] for item in visibility_res.data or []],
+            answer_key=AnswerKey.compile(questions),
+        )
+
+    def get(self, sb: Client, quiz_id) -> Optional[QuizDefinition]:
+        """Definisi kuis dari cache, atau dibaca dari database (pakai client admin). None bila kuis tidak ada."""
+        key = str(quiz_id)
+        definition = self._lookup(key)
+        if definition is not None:
+            return definition
+
+        with self._lock:
+            load_entry = self._load_locks.get(key)
+            if load_entry is None:
+                load_entry = self._load_locks[key] = [threading.Lock(), 0]
+            load_entry[1] += 1
+        try:
+            # Satu load per kuis: permintaan lain saat ujian dimulai menunggu hasilnya
+            with load_entry[0]:
+                definition = self._lookup(key)
+                if definition is not None:
+                    return definition
+                with self._lock:
+                    self.misses += 1
+                    version = self._versions.get(key, 0)
+                definition = self._load(sb, key, version)
+                with self._lock:
+                    if definition is None:
+                        return None
+                    if version != self._versions.get(key, 0):
+                        # Kuis diubah selama load; hasil tetap dikembalikan tetapi tidak disimpan
+                        self.stale_loads += 1
+                        return definition
+                    self._entries[key] = definition
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return definition
+        finally:
+            # Lock dilepas dari dict hanya setelah tidak ada thread yang menunggunya
+            with self._lock:
+                load_entry[1] -= 1
+                if load_entry[1] == 0 and self._load_locks.get(key) is load_entry:
+                    del self._load_locks[key]
+
+    async def aget(self, sb: Client, quiz_id) -> Optional[QuizDefinition]:
+        """Seperti get() untuk handler async: hit dilayani langsung, miss dimuat di thread."""
+        definition = self._lookup(str(quiz_id))
+        if definition is not None:
+            return definition
+        return await asyncio.to_thread(self.get, sb, quiz_id)
+
+    def invalidate(self, quiz_id):
+        key = str(quiz_id)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "stale_loads": self.stale_loads,
+        }
+
+
+quiz_definition_cache = QuizDefinitionCache(
+    max_entries=settings.quiz_cache_max_entries,
+    ttl_seconds=settings.quiz_cache_ttl_seconds,
+)
@@ -0,0 +1,107 @@
+import httpx
+from typing import Optional
+from supabase import Client
+
+from ..config import settings
+from ..schemas import QuizGenerationRequest
+from .singleflight import SingleFlight
+from .admission import ai_admission, PRIORITY_TEACHER
+
+# Materi yang diproses sebelum content_version ada tetap bisa di-cache
+UNVERSIONED = "unversioned"
+
+
+class QuizGenerationService:
+    """Membuat soal kuis dari materi melalui Edge Function generate-quiz.
+
+    Hasil disimpan di tabel generated_quiz_cache per (materi, versi konten,
+    tipe, jumlah soal, tingkat kesulitan) sehingga guru lain yang meminta
+    kuis yang sama mendapat hasil seketika.
+    """
+
+    def __init__(self):
+        # Permintaan identik (materi + opsi sama) yang bersamaan berbagi satu generasi
+        self.flight = SingleFlight()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cache_key(self, request: QuizGenerationRequest, content_version: Optional[str]) -> dict:
+        return {
+            "material_id": request.material_id,
+            "content_version": content_version or UNVERSIONED,
+            "quiz_type": request.quiz_type,
+            "num_questions": request.num_questions,
+            "difficulty": request.difficulty,
+        }
+
+    def _get_cached(self, sb: Client, key: dict) -> Optional[dict]:
+        query = sb.table("generated_quiz_cache").select("quiz_data")
+        for column, value in key.items():
+            query = query.eq(column, value)
+        res = query.order("created_at", desc=True).limit(1).execute()
+        return res.data[0]["quiz_data"] if res.data else None
+
+    def _store(self, sb: Client, key: dict, quiz_data: dict):
+        try:
+            sb.table("generated_quiz_cache").insert({**key, "quiz_data": quiz_data}).execute()
+        except Exception as e:
+            # Cache is best-effort; the generated quiz is still returned
+            print(f"Error storing generated quiz for material {key['material_id']}: {e}")
+
+    async def generate(self, token: str, request: QuizGenerationRequest, class_id: str, sb: Client, content_version: Optional[str] = None) -> dict:
+        """Mengembalikan quiz_data hasil generasi (dari cache jika ada dan request.fresh False).
+
+        Error httpx dan AdmissionRejected diteruskan ke pemanggil agar router bisa
+        memetakannya ke HTTPException.
+        """
+        key = self._cache_key(request, content_version)
+        if not request.fresh:
+            cached = self._get_cached(sb, key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        self.cache_misses += 1
+
+        async def generate_and_store():
+            quiz_data = await self._call_edge_function(token, request, class_id)
+            self._store(sb, key, quiz_data)
+            return quiz_data
+
+        flight_key = (*key.values(), request.fresh)
+        return await self.flight.do(flight_key, generate_and_store)
+
+    async def _call_edge_function(self, token: str, request: QuizGenerationRequest, class_id: str) -> dict:
+        # Construct the URL for the Supabase Edge Function
+        edge_function_url = f"{settings.supabase_url}/functions/v1/generate-quiz"
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}" # Raw JWT token of the requesting user
+        }
+        payload = {
+            "material_id": request.material_id,
+            "question_type": request.quiz_type, # Map quiz_type to question_type for Edge Function
+            "num_questions": request.num_questions,
+            "difficulty": request.difficulty,
+        }
+
+        # Generasi kuis dimulai oleh guru, sehingga mendapat prioritas di antrean AI
+        async with ai_admission.slot(class_id, PRIORITY_TEACHER):
+            async with httpx.AsyncClient() as client:
+                response = await client.post(edge_function_url, headers=headers, json=payload)
+                response.raise_for_status() # Raise an exception for 4xx/5xx responses
+
+                # The Edge Function returns a JSON with a "questions" key
+                return response.json()
+
+    def stats(self) -> dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "single_flight": self.flight.stats(),
+        }
+
+
+quiz_generation_service = QuizGenerationService()
@@ -1,34 +1,158 @@
 import io
+import codecs
+import json
+import hashlib
+import asyncio
 import httpx # New import for making HTTP requests
-import google.generativeai as genai # Keep for process_material_for_rag if still used
 from supabase import Client # Keep for process_material_for_rag if still used
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from unstructured.partition.auto import partition
-from typing import List
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pypdf import PdfReader
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from dataclasses import dataclass
 from pdf2image import convert_from_bytes
 from PIL import Image
 import base64
 
 from ..config import settings
 from backend.supabase_client import supabase # Keep for process_material_for_rag if still used
+from .lexical_index import class_material_ids, lexical_index, is_confident_lexical_match, reciprocal_rank_fusion
+from .answer_cache import answer_cache
+from .embeddings import embedding_service
+from .embedding_providers import TASK_DOCUMENT
+from .extraction_cache import ExtractionResult, content_hash, extraction_cache, normalize_extracted_text
+from .ocr_cache import ocr_page_cache, page_hash
+from .ocr_preprocess import OcrImageOptions, encode_page, prepare_page
+from .ingestion_admission import estimate_ingestion_bytes, ingestion_admission
+from .context_packer import context_packer
+from .sse import format_sse, iter_sse_events
+from .singleflight import SingleFlight
+from .text import normalize_text
+from .admission import ai_admission, AdmissionRejected, PRIORITY_STUDENT
 
-# Konfigurasi Gemini (only if process_material_for_rag still uses it)
-try:
-    genai.configure(api_key=settings.gemini_api_key)
-except Exception as e:
-    print(f"Tidak dapat mengkonfigurasi Gemini API key: {e}")
+# Gemini dikonfigurasi oleh GeminiEmbeddingProvider (services/embedding_providers.py)
 
 # Remove chat_model and embeddingModel initialization as they are now in Edge Function
-# Remove generate_query_embedding as it's now in Edge Function
 
-def get_text_from_file(file_content: bytes, mime_type: str) -> str:
-    """Mengekstrak teks dari konten byte sebuah file menggunakan unstructured."""
+MIME_PDF = "application/pdf"
+MIME_PPTX = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+MIME_TXT = "text/plain"
+
+def _pptx_shape_texts(shape) -> List[str]:
+    """Teks sebuah shape PPTX, termasuk tabel dan shape di dalam grup."""
+    if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+        return [text for child in shape.shapes for text in _pptx_shape_texts(child)]
+    if getattr(shape, "has_table", False) and shape.has_table:
+        return [" | ".join(cell.text.strip() for cell in row.cells) for row in shape.table.rows]
+    if getattr(shape, "has_text_frame", False) and shape.has_text_frame and shape.text_frame.text.strip():
+        return [shape.text_frame.text.strip()]
+    return []
+
+def extract_pptx_elements(file_content: bytes) -> List[dict]:
+    """Teks PPTX per slide (judul, isi, tabel) beserta catatan pembicara."""
+    presentation = Presentation(io.BytesIO(file_content))
+    elements = []
+    for page, slide in enumerate(presentation.slides, start=1):
+        title_shape = slide.shapes.title
+        for shape in slide.shapes:
+            element_type = "Title" if title_shape is not None and shape.shape_id == title_shape.shape_id else "NarrativeText"
+            for text in _pptx_shape_texts(shape):
+                elements.append({"type": element_type, "text": text, "page": page})
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame.text.strip() if slide.notes_slide.notes_text_frame else ""
+            if notes:
+                elements.append({"type": "SlideNotes", "text": notes, "page": page})
+    return elements
+
+def extract_pdf_elements(file_content: bytes) -> List[dict]:
+    """Lapisan teks PDF per halaman (pypdf). Halaman hasil scan tanpa teks ditangani oleh OCR."""
+    reader = PdfReader(io.BytesIO(file_content))
+    elements = []
+    for page, pdf_page in enumerate(reader.pages, start=1):
+        text = (pdf_page.extract_text() or "").strip()
+        if text:
+            elements.append({"type": "PageText", "text": text, "page": page})
+    return elements
+
+_ENCODING_SAMPLE_SIZE = 64 * 1024
+
+def detect_text_encoding(sample: bytes) -> str:
+    """Menebak encoding dari awal file: BOM, UTF-8, charset_normalizer (jika terpasang), lalu cp1252."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if len(sample) >= _ENCODING_SAMPLE_SIZE:
+        # Sampel bisa terpotong di tengah karakter multi-byte (maksimal 3 byte lanjutan)
+        sample = sample[:-3]
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        pass
+    return "cp1252"
+
+def extract_txt_elements(file_content: bytes) -> List[dict]:
+    """Teks polos dibaca baris demi baris dan dikelompokkan per paragraf."""
+    encoding = detect_text_encoding(file_content[:_ENCODING_SAMPLE_SIZE])
+    stream = io.TextIOWrapper(io.BytesIO(file_content), encoding=encoding, errors="replace", newline=None)
+    elements, paragraph = [], []
+    for line in stream:
+        if line.strip():
+            paragraph.append(line.rstrip())
+        elif paragraph:
+            elements.append({"type": "NarrativeText", "text": "\n".join(paragraph), "page": None})
+            paragraph = []
+    if paragraph:
+        elements.append({"type": "NarrativeText", "text": "\n".join(paragraph), "page": None})
+    return elements
+
+# Ekstraktor cepat per mime type; unstructured dipakai bila tidak ada, gagal, atau tidak
+# menemukan teks (kecuali PDF tanpa lapisan teks, yang ditangani OCR)
+EXTRACTORS: Dict[str, Callable[[bytes], List[dict]]] = {
+    MIME_PDF: extract_pdf_elements,
+    MIME_PPTX: extract_pptx_elements,
+    MIME_TXT: extract_txt_elements,
+}
+
+def extract_unstructured_elements(file_content: bytes, mime_type: str) -> List[dict]:
+    elements = partition(file=io.BytesIO(file_content), content_type=mime_type, languages=['id']) # Added languages=['id']
+    return [
+        {"type": el.category, "text": str(el), "page": getattr(el.metadata, "page_number", None)}
+        for el in elements
+    ]
+
+def get_elements_from_file(file_content: bytes, mime_type: str) -> List[dict]:
+    """Mengekstrak elemen teks (tipe, teks, halaman) dari konten byte sebuah file."""
+    extractor = EXTRACTORS.get((mime_type or "").split(";")[0].strip().lower())
+    if extractor is not None:
+        try:
+            elements = extractor(file_content)
+            if elements:
+                return elements
+            # PDF tanpa lapisan teks (hasil scan) sepenuhnya ditangani OCR
+            if extractor is extract_pdf_elements:
+                return []
+        except Exception as e:
+            print(f"Error pada ekstraktor {mime_type}, falling back to unstructured: {e}")
     try:
-        elements = partition(file=io.BytesIO(file_content), content_type=mime_type, languages=['id']) # Added languages=['id']
-        return "\n".join([str(el) for el in elements])
+        return extract_unstructured_elements(file_content, mime_type)
     except Exception as e:
         print(f"Error mengekstrak teks dengan unstructured untuk mime_type {mime_type}: {e}")
-        return ""
+        return []
+
+def get_text_from_file(file_content: bytes, mime_type: str) -> str:
+    """Mengekstrak teks dari konten byte sebuah file."""
+    return "\n".join(el["text"] for el in get_elements_from_file(file_content, mime_type))
 
 def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
     """Memecah teks menjadi potongan-potongan yang saling tumpang tindih."""
@@ -40,83 +164,131 @@ def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> l
     return text_splitter.split_text(text)
 
 def generate_embeddings(text_chunks: list[str]) -> list[list[float]]:
-    """Membuat embeddings untuk daftar potongan teks menggunakan Gemini."""
+    """Membuat embeddings untuk daftar potongan teks menggunakan penyedia embedding yang dikonfigurasi."""
     if not text_chunks:
         return []
-    model = 'models/text-embedding-004' # Changed model name
-    result = genai.embed_content(model=model, content=text_chunks, task_type="retrieval_document")
-    return result['embedding']
+    return embedding_service.provider.embed(text_chunks, TASK_DOCUMENT)
 
-async def process_material_for_rag(material_id: str, storage_path: str, sb: Client):
-    """Fungsi utama pipeline RAG untuk dijalankan di background."""
-    print(f"Memulai pemrosesan RAG untuk material_id: {material_id}")
-    try:
-        # 1. Unduh file dari Supabase Storage
-        meta_res = sb.table("materials").select("mime_type").eq("id", material_id).single().execute()
-        if not meta_res.data:
-            print(f"Error: Materi dengan ID {material_id} tidak ditemukan.")
-            return
-        mime_type = meta_res.data['mime_type']
-        
-        file_content = sb.storage.from_("materials").download(storage_path)
-        if not file_content:
-            print(f"Error: Tidak dapat mengunduh file dari {storage_path}")
-            return
 
-        # 2. Ekstrak teks
-        all_extracted_text_parts = []
+def material_class_ids(sb: Client, material_id: str) -> List[str]:
+    """Semua kelas yang memakai materi: pemiliknya (materials.class_id) dan tautan class_materials."""
+    class_ids = []
+    material_res = sb.table("materials").select("class_id").eq("id", str(material_id)).execute()
+    for row in material_res.data or []:
+        if row.get("class_id"):
+            class_ids.append(str(row["class_id"]))
+    class_res = sb.table("class_materials").select("class_id").eq("material_id", str(material_id)).execute()
+    class_ids.extend(str(c["class_id"]) for c in class_res.data or [])
+    return list(dict.fromkeys(class_ids))
 
-        # Try to extract text using unstructured first
-        unstructured_text = get_text_from_file(file_content, mime_type)
-        if unstructured_text:
-            all_extracted_text_parts.append(unstructured_text)
 
-        # If it's a PDF, also try to extract text from images via OCR Edge Function
-        if mime_type == "application/pdf":
-            try:
-                # Convert PDF bytes to images
-                images = convert_from_bytes(file_content)
-                ocr_edge_function_url = f"{settings.supabase_url}/functions/v1/ocr-pdf-image"
+async def extract_material(file_content: bytes, mime_type: str, material_id: str, sb: Client) -> ExtractionResult:
+    """Mengekstrak teks materi: unstructured, ditambah OCR halaman PDF melalui Edge Function."""
+    # Try to extract text using unstructured first
+    elements = get_elements_from_file(file_content, mime_type)
 
-                for i, image in enumerate(images):
-                    # Convert PIL Image to bytes (PNG format)
-                    img_byte_arr = io.BytesIO()
-                    image.save(img_byte_arr, format='PNG')
-                    img_bytes = img_byte_arr.getvalue()
+    # If it's a PDF, also try to extract text from images via OCR Edge Function
+    if mime_type == "application/pdf":
+        try:
+            # Render pages at the OCR resolution, then shrink them before upload
+            options = OcrImageOptions.from_settings()
+            images = convert_from_bytes(file_content, dpi=options.dpi, grayscale=options.color_mode != "color")
+            ocr_edge_function_url = f"{settings.supabase_url}/functions/v1/ocr-pdf-image"
+
+            for i, image in enumerate(images):
+                image = prepare_page(image, options)
+                # Halaman yang sama (sampul, templat lembar kerja) hanya di-OCR sekali
+                key = page_hash(image, settings.ocr_cache_hash_mode)
+                extracted_text = ocr_page_cache.get(sb, key)
+                if extracted_text is None:
+                    img_bytes, image_mime_type = encode_page(image, options)
 
                     # Base64 encode the image
                     encoded_image = base64.b64encode(img_bytes).decode('utf-8')
 
                     # Call the OCR Edge Function
-                    ocr_payload = {"image_base64": encoded_image}
+                    ocr_payload = {"image_base64": encoded_image, "mime_type": image_mime_type}
                     ocr_headers = {"Content-Type": "application/json"}
 
                     async with httpx.AsyncClient(timeout=60.0) as client:
                         ocr_response = await client.post(ocr_edge_function_url, headers=ocr_headers, json=ocr_payload)
                         ocr_response.raise_for_status()
-                        ocr_result = ocr_response.json()
+                        extracted_text = ocr_response.json().get("extracted_text") or ""
+                    ocr_page_cache.put(sb, key, extracted_text)
+                else:
+                    print(f"OCR cache hit for page {i+1} of material {material_id}")
 
-                        if "extracted_text" in ocr_result and ocr_result["extracted_text"]:
-                            all_extracted_text_parts.append(ocr_result["extracted_text"])
-                            print(f"OCR successful for page {i+1} of material {material_id}")
-                        else:
-                            print(f"OCR returned no text for page {i+1} of material {material_id}")
-
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP Error calling OCR Edge Function for material {material_id}: Status {e.response.status_code}")
-                print(f"Response body: {e.response.text}")
-                print(f"Full exception: {e}")
-            except httpx.RequestError as e:
-                print(f"Request Error calling OCR Edge Function for material {material_id}: {e}")
-                import traceback
-                traceback.print_exc()
-            except Exception as e:
-                print(f"Generic Error during PDF image processing or OCR for material {material_id}: {e}")
-                import traceback
-                traceback.print_exc() # Print full traceback
-            # Continue even if image OCR fails, using whatever text was extracted by unstructured
-
-        text = "\n".join(all_extracted_text_parts)
+                if extracted_text:
+                    elements.append({"type": "OcrPage", "text": extracted_text, "page": i + 1})
+                    print(f"OCR successful for page {i+1} of material {material_id}")
+                else:
+                    print(f"OCR returned no text for page {i+1} of material {material_id}")
+
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP Error calling OCR Edge Function for material {material_id}: Status {e.response.status_code}")
+            print(f"Response body: {e.response.text}")
+            print(f"Full exception: {e}")
+        except httpx.RequestError as e:
+            print(f"Request Error calling OCR Edge Function for material {material_id}: {e}")
+            import traceback
+            traceback.print_exc()
+        except Exception as e:
+            print(f"Generic Error during PDF image processing or OCR for material {material_id}: {e}")
+            import traceback
+            traceback.print_exc() # Print full traceback
+        # Continue even if image OCR fails, using whatever text was extracted by unstructured
+
+    text = normalize_extracted_text("\n".join(el["text"] for el in elements))
+    return ExtractionResult(text, elements)
+
+async def get_material_extraction(material_id: str, storage_path: str, sb: Client) -> Optional[ExtractionResult]:
+    """Mengambil teks hasil ekstraksi materi, dari cache bila file yang sama pernah diekstrak."""
+    cached = extraction_cache.get_for_material(sb, material_id)
+    if cached is not None:
+        print(f"DEBUG: Using cached extraction for material {material_id}")
+        return cached
+
+    # 1. Unduh file dari Supabase Storage
+    meta_res = sb.table("materials").select("mime_type").eq("id", material_id).single().execute()
+    if not meta_res.data:
+        print(f"Error: Materi dengan ID {material_id} tidak ditemukan.")
+        return None
+    mime_type = meta_res.data['mime_type']
+
+    file_content = sb.storage.from_("materials").download(storage_path)
+    if not file_content:
+        print(f"Error: Tidak dapat mengunduh file dari {storage_path}")
+        return None
+
+    # 2. Ekstrak teks (file identik yang diunggah ulang memakai hasil sebelumnya)
+    file_hash = content_hash(file_content)
+    result = extraction_cache.get(sb, file_hash)
+    if result is None:
+        result = await extract_material(file_content, mime_type, material_id, sb)
+        if result.text:
+            extraction_cache.put(sb, file_hash, mime_type, result)
+    sb.table("materials").update({"content_hash": file_hash}).eq("id", material_id).execute()
+    return result
+
+async def process_material_for_rag(material_id: str, storage_path: str, sb: Client, estimated_bytes: Optional[int] = None, replace_existing: bool = False):
+    """Fungsi utama pipeline RAG untuk dijalankan di background.
+
+    estimated_bytes adalah perkiraan memori run ini (lihat estimate_ingestion_bytes);
+    run menunggu di antrean ingestion sampai slot dan anggaran memori tersedia.
+    replace_existing menukar chunk lama dengan yang baru dalam satu transaksi.
+    """
+    if estimated_bytes is None:
+        estimated_bytes = estimate_ingestion_bytes(None, None)
+    async with ingestion_admission.reserve(estimated_bytes):
+        await _process_material_for_rag(material_id, storage_path, sb, replace_existing)
+
+async def _process_material_for_rag(material_id: str, storage_path: str, sb: Client, replace_existing: bool = False):
+    print(f"Memulai pemrosesan RAG untuk material_id: {material_id}")
+    try:
+        extraction = await get_material_extraction(material_id, storage_path, sb)
+        if extraction is None:
+            return
+        text = extraction.text
 
         if not text:
             print(f"Peringatan: Tidak ada teks yang diekstrak dari materi {material_id}.")
@@ -142,49 +314,195 @@ async def process_material_for_rag(material_id: str, storage_path: str, sb: Clie
             for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
         ]
         
-        sb.table("material_embeddings").insert(rows_to_insert).execute()
+        if replace_existing:
+            # Chunk lama tetap bisa dicari sampai chunk baru tersimpan
+            sb.rpc("replace_material_embeddings", {"p_material_id": material_id, "p_rows": rows_to_insert}).execute()
+        else:
+            sb.table("material_embeddings").insert(rows_to_insert).execute()
+
+        # Versi konten menandai cache kuis hasil generasi yang masih berlaku
+        content_version = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        sb.table("materials").update({"content_version": content_version}).eq("id", material_id).execute()
+
+        # 6. Perbarui indeks leksikal (BM25) kelas yang memakai materi ini
+        class_ids = material_class_ids(sb, material_id)
+        lexical_index.add_chunks(class_ids, material_id, chunks)
+
+        # 7. Jawaban AI yang di-cache untuk kelas tersebut sudah tidak berlaku
+        for class_id in class_ids:
+            answer_cache.invalidate(class_id)
         
         print(f"Berhasil memproses dan meng-embed materi {material_id}")
 
     except Exception as e:
         print(f"Error memproses materi {material_id} untuk RAG: {e}")
 
+async def reprocess_material_for_rag(material_id: str, sb: Client):
+    """Memecah dan meng-embed ulang materi dari teks hasil ekstraksi yang di-cache.
+
+    Dipakai setelah parameter chunking atau model embedding berubah; file hanya
+    diunduh dan diekstrak ulang bila belum ada di cache. Chunk lama baru diganti
+    setelah chunk baru berhasil di-embed, sehingga materi tetap bisa dipakai chat
+    selama proses berjalan dan tetap utuh bila proses gagal.
+    """
+    material_res = sb.table("materials").select("storage_path").eq("id", material_id).single().execute()
+    if not material_res.data:
+        print(f"Error: Materi dengan ID {material_id} tidak ditemukan.")
+        return
+    await process_material_for_rag(material_id, material_res.data["storage_path"], sb, replace_existing=True)
+
+NO_CONTEXT_RESPONSE = "Maaf, saya tidak menemukan informasi relevan dalam materi kelas ini maupun definisi umum untuk pertanyaan Anda."
+
+def _chunk_key(row: dict) -> tuple:
+    """Kunci identitas chunk untuk penggabungan hasil leksikal dan vektor."""
+    if row.get("material_id") is not None and row.get("chunk_index") is not None:
+        return (str(row["material_id"]), int(row["chunk_index"]))
+    return ("", row["text"])
+
+@dataclass
+class RetrievalResult:
+    context_chunks: List[str]
+    query_embedding: Optional[List[float]] = None # None when retrieval was lexical-only
+    tokens_saved: int = 0 # Estimated prompt tokens removed by context packing
+
 class RAGService:
-    async def get_ai_response_for_class(self, user_id: str, class_id: str, question: str) -> str:
+    def __init__(self):
+        # Pertanyaan identik di kelas yang sama berbagi satu pemanggilan Edge Function
+        self.chat_flight = SingleFlight()
+
+    async def retrieve_context(self, sb: Client, class_id: str, question: str, query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+        """Mengambil konteks materi (hybrid BM25 + vektor) dan definisi umum untuk pertanyaan.
+
+        query_embedding dapat diberikan bila pemanggil sudah meng-embed pertanyaan.
+        """
+        # class_materials dibaca setiap permintaan, seperti retrieval di Edge Function
+        material_ids = await asyncio.to_thread(class_material_ids, sb, class_id)
+        lexical_hits = await lexical_index.asearch(sb, class_id, question, material_ids=material_ids)
+
+        # Pertanyaan kata kunci yang cocok penuh secara leksikal tidak perlu embedding
+        if is_confident_lexical_match(question, lexical_hits):
+            packed = context_packer.pack([((hit.material_id, hit.chunk_index), hit.text) for hit in lexical_hits])
+            return RetrievalResult(packed.chunks, query_embedding, packed.tokens_saved)
+
+        if query_embedding is None:
+            query_embedding = await embedding_service.embed_query(question)
+
+        texts = {}
+        vector_keys = []
+        if material_ids:
+            vector_rows = sb.rpc("search_material_embeddings", {
+                "query_embedding": query_embedding,
+                "material_ids": material_ids,
+                "match_count": settings.rag_top_k,
+            }).execute().data or []
+            for row in vector_rows:
+                key = _chunk_key(row)
+                texts[key] = row["text"]
+                vector_keys.append(key)
+
+        lexical_keys = []
+        for hit in lexical_hits:
+            key = (hit.material_id, hit.chunk_index)
+            texts.setdefault(key, hit.text)
+            lexical_keys.append(key)
+
+        fused_keys = reciprocal_rank_fusion([vector_keys, lexical_keys])[:settings.rag_top_k]
+
+        definitions = sb.rpc("search_general_definitions", {
+            "query_embedding": query_embedding,
+            "filter_class_id": class_id,
+            "match_count": settings.definition_match_count,
+            "match_threshold": settings.definition_match_threshold,
+        }).execute().data or []
+        definition_chunks = [f"Definisi Umum: {d['term']} - {d['definition']}" for d in definitions]
+
+        packed = context_packer.pack([(key, texts[key]) for key in fused_keys], definition_chunks)
+        return RetrievalResult(packed.chunks, query_embedding, packed.tokens_saved)
+
+    async def _prepare_chat(self, sb: Client, class_id: str, question: str):
+        """Menyiapkan payload Edge Function ai-chat.
+
+        Mengembalikan (answer, payload, retrieval). Jika answer terisi, pertanyaan
+        bisa dijawab tanpa generasi (cache semantik atau tidak ada konteks).
+        """
+        payload = {
+            "class_id": class_id,
+            "question": question
+        }
+
+        # Retrieval dilakukan di sini; Edge Function hanya menyusun prompt dan memanggil Gemini.
+        # Jika retrieval gagal, Edge Function melakukan retrieval vektornya sendiri.
+        retrieval = None
         try:
-            # Construct the URL for the Supabase Edge Function
-            # This assumes the Edge Function is deployed and accessible
-            # The URL format is typically: https://<project-ref>.supabase.co/functions/v1/<function-name>
-            # We need to get SUPABASE_URL from settings and append the function path.
-            edge_function_url = f"{settings.supabase_url}/functions/v1/ai-chat"
-
-            headers = {
-                "Content-Type": "application/json",
-                # Pass the Authorization header from the incoming request if available
-                # This assumes the FastAPI endpoint receives the user's JWT
-                "Authorization": f"Bearer {user_id}" # user_id here is actually the JWT token
-            }
-            payload = {
-                "class_id": class_id,
-                "question": question
-            }
+            # Cache semantik dicek sebelum retrieval, sehingga hit hanya membutuhkan embedding
+            query_embedding = await embedding_service.embed_query(question)
+            cached_answer = answer_cache.get_similar(class_id, query_embedding)
+            if cached_answer is not None:
+                return cached_answer, None, RetrievalResult([], query_embedding)
+            retrieval = await self.retrieve_context(sb, class_id, question, query_embedding)
+            if not retrieval.context_chunks:
+                return NO_CONTEXT_RESPONSE, None, retrieval
+            payload["context_chunks"] = retrieval.context_chunks
+        except Exception as e:
+            print(f"Error during hybrid retrieval for class {class_id}, falling back to Edge Function retrieval: {e}")
 
-            print(f"DEBUG: Sending Authorization header to Edge Function: {headers['Authorization']}") # DEBUG PRINT
+        return None, payload, retrieval
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(edge_function_url, headers=headers, json=payload)
-                response.raise_for_status() # Raise an exception for 4xx/5xx responses
+    def _edge_function_request(self, user_id: str):
+        # Construct the URL for the Supabase Edge Function
+        # This assumes the Edge Function is deployed and accessible
+        # The URL format is typically: https://<project-ref>.supabase.co/functions/v1/<function-name>
+        # We need to get SUPABASE_URL from settings and append the function path.
+        edge_function_url = f"{settings.supabase_url}/functions/v1/ai-chat"
 
-                edge_function_response = response.json()
-                
-                if "response" in edge_function_response:
-                    return edge_function_response["response"]
-                elif "error" in edge_function_response:
-                    print(f"Error from Edge Function: {edge_function_response['error']}")
-                    return f"Maaf, terjadi kesalahan pada AI Assistant: {edge_function_response['error']}"
-                else:
-                    return "Maaf, terjadi kesalahan yang tidak diketahui dari AI Assistant."
+        headers = {
+            "Content-Type": "application/json",
+            # Pass the Authorization header from the incoming request if available
+            # This assumes the FastAPI endpoint receives the user's JWT
+            "Authorization": f"Bearer {user_id}" # user_id here is actually the JWT token
+        }
+        return edge_function_url, headers
 
+    async def get_ai_response_for_class(self, user_id: str, class_id: str, question: str, sb: Client, priority: int = PRIORITY_STUDENT) -> str:
+        """Menjawab pertanyaan kelas.
+
+        AdmissionRejected diteruskan ke pemanggil jika antrean pemanggilan AI penuh.
+        """
+        # Pertanyaan yang sama persis (setelah normalisasi) dijawab langsung dari cache
+        cached_answer = answer_cache.get(class_id, question)
+        if cached_answer is not None:
+            return cached_answer
+
+        key = (str(class_id), normalize_text(question))
+        return await self.chat_flight.do(key, lambda: self._answer_question(user_id, class_id, question, sb, priority))
+
+    async def _answer_question(self, user_id: str, class_id: str, question: str, sb: Client, priority: int) -> str:
+        try:
+            # Hanya pemanggilan pertama dari permintaan yang digabung yang memakai slot AI
+            async with ai_admission.slot(class_id, priority):
+                answer, payload, retrieval = await self._prepare_chat(sb, class_id, question)
+                if answer is not None:
+                    return answer
+
+                edge_function_url, headers = self._edge_function_request(user_id)
+
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(edge_function_url, headers=headers, json=payload)
+                    response.raise_for_status() # Raise an exception for 4xx/5xx responses
+
+                    edge_function_response = response.json()
+
+            if "response" in edge_function_response:
+                answer_cache.put(class_id, question, edge_function_response["response"], retrieval.query_embedding if retrieval else None)
+                return edge_function_response["response"]
+            elif "error" in edge_function_response:
+                print(f"Error from Edge Function: {edge_function_response['error']}")
+                return f"Maaf, terjadi kesalahan pada AI Assistant: {edge_function_response['error']}"
+            else:
+                return "Maaf, terjadi kesalahan yang tidak diketahui dari AI Assistant."
+
+        except AdmissionRejected:
+            raise
         except httpx.HTTPStatusError as e:
             print(f"HTTP error calling Edge Function: {e.response.status_code} - {e.response.text}")
             return f"Maaf, terjadi kesalahan saat menghubungi AI Assistant (Kode: {e.response.status_code})."
@@ -195,4 +513,75 @@ class RAGService:
             print(f"Error in get_ai_response_for_class (Python backend): {e}")
             return "Maaf, terjadi kesalahan internal saat mencoba menjawab pertanyaan Anda."
 
+    async def stream_ai_response_for_class(self, user_id: str, class_id: str, question: str, sb: Client, priority: int = PRIORITY_STUDENT) -> AsyncIterator[str]:
+        """Menjawab pertanyaan sebagai Server-Sent Events, token demi token.
+
+        Event "message" berisi {"token": ...}, diakhiri event "done" berisi jawaban
+        lengkap atau event "error". Menutup generator ini (klien terputus) menutup
+        koneksi ke Edge Function sehingga generasi di hulu ikut dibatalkan.
+        """
+        try:
+            answer = answer_cache.get(class_id, question)
+            if answer is not None:
+                yield format_sse({"token": answer})
+                yield format_sse({"response": answer}, event="done")
+                return
+
+            async with ai_admission.slot(class_id, priority):
+                answer, payload, retrieval = await self._prepare_chat(sb, class_id, question)
+                if answer is not None:
+                    yield format_sse({"token": answer})
+                    yield format_sse({"response": answer}, event="done")
+                    return
+
+                edge_function_url, headers = self._edge_function_request(user_id)
+                payload["stream"] = True
+                tokens = []
+
+                async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=120.0)) as client:
+                    async with client.stream("POST", edge_function_url, headers=headers, json=payload) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                        response.raise_for_status()
+
+                        # Edge Function versi lama (atau jawaban tanpa konteks) membalas JSON biasa
+                        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                            edge_function_response = json.loads(await response.aread())
+                            if "response" not in edge_function_response:
+                                raise ValueError(edge_function_response.get("error", "Unknown response from AI Assistant"))
+                            tokens.append(edge_function_response["response"])
+                            yield format_sse({"token": tokens[0]})
+                        else:
+                            completed = False
+                            async for event, data in iter_sse_events(response.aiter_lines()):
+                                if event == "error":
+                                    raise ValueError(json.loads(data).get("error"))
+                                if event == "done":
+                                    completed = True
+                                    break
+                                token = json.loads(data).get("token", "")
+                                if token:
+                                    tokens.append(token)
+                                    yield format_sse({"token": token})
+                            if not completed:
+                                raise ValueError("AI Assistant stream ended before the answer was complete")
+
+            full_answer = "".join(tokens)
+            # Hanya jawaban lengkap yang di-cache; stream terputus sudah keluar lewat exception di atas
+            if full_answer:
+                answer_cache.put(class_id, question, full_answer, retrieval.query_embedding if retrieval else None)
+            yield format_sse({"response": full_answer}, event="done")
+
+        except AdmissionRejected as e:
+            yield format_sse({"error": e.reason, "retry_after": e.retry_after}, event="error")
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error streaming from Edge Function: {e.response.status_code} - {e.response.text}")
+            yield format_sse({"error": f"Maaf, terjadi kesalahan saat menghubungi AI Assistant (Kode: {e.response.status_code})."}, event="error")
+        except httpx.RequestError as e:
+            print(f"Request error streaming from Edge Function: {e}")
+            yield format_sse({"error": "Maaf, terjadi masalah jaringan saat menghubungi AI Assistant."}, event="error")
+        except Exception as e:
+            print(f"Error in stream_ai_response_for_class (Python backend): {e}")
+            yield format_sse({"error": f"Maaf, terjadi kesalahan pada AI Assistant: {e}"}, event="error")
+
 rag_service = RAGService()
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from supabase import Client
+
+from .admission import TokenBucket
+from .answer_cache import answer_cache
+from .embedding_providers import EmbeddingProvider, TASK_DOCUMENT, get_embedding_provider
+from .embeddings import embedding_service
+
+# Tabel yang di-embed ulang dan kolom teks sumbernya
+REEMBED_TABLES = {
+    "material_embeddings": "text",
+    "general_definitions": "definition",
+}
+
+
+@dataclass
+class TableProgress:
+    table: str
+    total: int = 0
+    processed: int = 0
+    last_id: Optional[str] = None
+    done: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "processed": self.processed,
+            "remaining": max(0, self.total - self.processed),
+            "last_id": self.last_id,
+            "done": self.done,
+        }
+
+
+@dataclass
+class ReembeddingRun:
+    provider: str
+    model: str
+    status: str = "running" # running, completed, failed
+    tables: Dict[str, TableProgress] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    rows_this_run: int = 0
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        throughput = self.rows_this_run / elapsed if elapsed > 0 else 0.0
+        remaining = sum(max(0, t.total - t.processed) for t in self.tables.values())
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "status": self.status,
+            "tables": {name: progress.to_dict() for name, progress in self.tables.items()},
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "rows_per_second": round(throughput, 2),
+            "eta_seconds": round(remaining / throughput) if throughput and self.status == "running" else None,
+            "error": self.error,
+        }
+
+
+class ReembeddingService:
+    """Embedding ulang seluruh chunk materi dan definisi ke kolom bayangan embedding_next.
+
+    Tabel dipindai urut id (keyset) per batch; checkpoint disimpan di tabel
+    reembedding_checkpoints setelah setiap batch sehingga proses yang terhenti
+    bisa dilanjutkan. Baris yang ditambahkan selama migrasi ditangkap oleh
+    pemindaian ulang baris yang embedding_next-nya masih kosong. Setelah semua
+    baris selesai, switch() menukar kolom kedua tabel dalam satu transaksi.
+    """
+
+    def __init__(self):
+        self.current: Optional[ReembeddingRun] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, sb: Client, provider: str, model: str, batch_size: int, batches_per_minute: float) -> ReembeddingRun:
+        if self.running:
+            raise RuntimeError("A re-embedding run is already in progress.")
+        embedder = get_embedding_provider(provider, model)
+        self.current = ReembeddingRun(provider=provider, model=model)
+        self._task = asyncio.ensure_future(self._run(sb, self.current, embedder, batch_size, batches_per_minute))
+        return self.current
+
+    def _load_checkpoint(self, sb: Client, table: str, model: str, dimension: int) -> TableProgress:
+        progress = TableProgress(table)
+        res = sb.table("reembedding_checkpoints").select("*").eq("table_name", table).execute()
+        if res.data and res.data[0]["model"] == model:
+            progress.last_id = res.data[0]["last_id"]
+            progress.processed = res.data[0]["processed"]
+        else:
+            # Checkpoint model lain berarti migrasi baru: embedding_next dibuat ulang dengan
+            # dimensi model baru, sekaligus membuang vektor model sebelumnya yang akan
+            # dilewati _fetch_batch karena sudah terisi
+            sb.rpc("clear_next_embeddings", {"target_table": table, "dimension": dimension}).execute()
+            self._save_checkpoint(sb, progress, model)
+        count_res = sb.table(table).select("id", count="exact").limit(1).execute()
+        progress.total = count_res.count or 0
+        return progress
+
+    def _save_checkpoint(self, sb: Client, progress: TableProgress, model: str):
+        sb.table("reembedding_checkpoints").upsert({
+            "table_name": progress.table,
+            "model": model,
+            "last_id": progress.last_id,
+            "processed": progress.processed,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+
+    def _fetch_batch(self, sb: Client, table: str, last_id: Optional[str], batch_size: int) -> List[dict]:
+        query = sb.table(table).select(f"id, {REEMBED_TABLES[table]}").is_("embedding_next", "null")
+        if last_id:
+            query = query.gt("id", last_id)
+        return query.order("id").limit(batch_size).execute().data or []
+
+    async def _run(self, sb: Client, run: ReembeddingRun, embedder: EmbeddingProvider, batch_size: int, batches_per_minute: float):
+        bucket = TokenBucket(batches_per_minute / 60, 1)
+        try:
+            dimension = await asyncio.to_thread(embedder.output_dimensions)
+            for table in REEMBED_TABLES:
+                run.tables[table] = self._load_checkpoint(sb, table, run.model, dimension)
+            for table, text_column in REEMBED_TABLES.items():
+                progress = run.tables[table]
+                caught_up = False
+                while True:
+                    rows = self._fetch_batch(sb, table, progress.last_id, batch_size)
+                    if not rows:
+                        if caught_up or progress.last_id is None:
+                            break
+                        # Pemindaian ulang dari awal untuk baris baru yang terlewat
+                        progress.last_id = None
+                        caught_up = True
+                        continue
+
+                    wait = bucket.try_acquire()
+                    while wait:
+                        await asyncio.sleep(wait)
+                        wait = bucket.try_acquire()
+
+                    embeddings = await asyncio.to_thread(embedder.embed, [row[text_column] or "" for row in rows], TASK_DOCUMENT)
+                    sb.rpc("set_next_embeddings", {
+                        "target_table": table,
+                        "rows": [{"id": row["id"], "embedding": embedding} for row, embedding in zip(rows, embeddings)],
+                    }).execute()
+
+                    progress.last_id = rows[-1]["id"]
+                    progress.processed += len(rows)
+                    progress.total = max(progress.total, progress.processed)
+                    run.rows_this_run += len(rows)
+                    self._save_checkpoint(sb, progress, run.model)
+                progress.done = True
+            run.status = "completed"
+        except Exception as e:
+            print(f"Error during re-embedding: {e}")
+            run.status = "failed"
+            run.error = str(e)
+        finally:
+            run.finished_at = time.time()
+
+    def switch(self, sb: Client, provider: str, model: str):
+        """Menukar embedding_next menjadi embedding di kedua tabel secara atomik.
+
+        provider/model adalah model yang mengisi embedding_next. Di proses ini,
+        embedding pertanyaan dan ingestion langsung beralih ke model tersebut dan
+        cache embedding pertanyaan serta jawaban dikosongkan. Worker lain dan
+        restart mengikuti settings.embedding_provider/embedding_model, yang harus
+        diperbarui ke model yang sama.
+        """
+        if self.running:
+            raise RuntimeError("Wait for the re-embedding run to finish before switching.")
+        res = sb.table("reembedding_checkpoints").select("table_name, model").execute()
+        models = {row["table_name"]: row["model"] for row in res.data or []}
+        if any(models.get(table) != model for table in REEMBED_TABLES):
+            raise RuntimeError(f"embedding_next was not fully written by model '{model}'; re-embed with it before switching.")
+        # Dibuat sebelum penukaran agar konfigurasi yang salah menggagalkan switch, bukan search
+        embedder = get_embedding_provider(provider, model)
+        sb.rpc("switch_to_next_embeddings", {}).execute()
+        embedding_service.use_provider(embedder)
+        answer_cache.invalidate()
+
+    def status(self) -> Optional[dict]:
+        return self.current.to_dict() if self.current else None
+
+
+reembedding_service = ReembeddingService()
@@ -0,0 +1,27 @@
+import json
+from typing import AsyncIterator, Optional, Tuple
+
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """Memformat satu Server-Sent Event dengan payload JSON."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iter_sse_events(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    """Mengurai aliran baris SSE menjadi pasangan (event, data).
+
+    Event tanpa baris "event:" bernama "message", sesuai spesifikasi SSE.
+    """
+    event, data_lines = "message", []
+    async for line in lines:
+        if not line:
+            if data_lines:
+                yield event, "\n".join(data_lines)
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+    if data_lines:
+        yield event, "\n".join(data_lines)
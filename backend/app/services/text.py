@@ -0,0 +1,76 @@
+import re
+import unicodedata
+from typing import List
+
+# Kata-kata umum Bahasa Indonesia yang tidak membawa makna untuk pencarian.
+INDONESIAN_STOPWORDS = frozenset({
+    "ada", "adalah", "agar", "akan", "aku", "anda", "apa", "apakah", "atas", "atau",
+    "bagaimana", "bagi", "bahwa", "banyak", "beberapa", "belum", "berapa", "bisa",
+    "dalam", "dan", "dapat", "dari", "dengan", "di", "dia", "ia", "ini", "itu",
+    "jadi", "jelaskan", "jika", "juga", "kami", "kamu", "kapan", "karena", "ke",
+    "kenapa", "ketika", "kita", "lagi", "lain", "maka", "mana", "mengapa", "mereka",
+    "oleh", "pada", "para", "saat", "saja", "sama", "sangat", "saya", "sebagai",
+    "sebuah", "secara", "sedang", "sehingga", "sejak", "seperti", "siapa", "suatu",
+    "sudah", "tentang", "tersebut", "tidak", "untuk", "yaitu", "yakni", "yang",
+    # English fallbacks, materials are sometimes bilingual
+    "a", "an", "and", "are", "is", "of", "or", "the", "to", "what", "how", "why",
+})
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_PARTICLES = ("lah", "kah", "tah", "pun")
+_POSSESSIVES = ("nya", "ku", "mu")
+_FIRST_ORDER_PREFIXES = ("meng", "meny", "men", "mem", "me", "peng", "peny", "pen", "pem", "di", "ter", "ke")
+_SECOND_ORDER_PREFIXES = ("ber", "bel", "be", "per", "pel", "pe")
+_SUFFIXES = ("kan", "an", "i")
+_MIN_STEM_LENGTH = 3
+
+
+def normalize_text(text: str) -> str:
+    """Menormalkan teks pertanyaan: huruf kecil, tanpa aksen dan spasi berlebih."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE_RE.sub(" ", text.lower()).strip()
+
+
+def _strip_suffix(word: str, suffixes: tuple) -> str:
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM_LENGTH:
+            return word[: -len(suffix)]
+    return word
+
+
+def _strip_prefix(word: str, prefixes: tuple) -> tuple[str, bool]:
+    for prefix in prefixes:
+        if word.startswith(prefix) and len(word) - len(prefix) >= _MIN_STEM_LENGTH:
+            return word[len(prefix):], True
+    return word, False
+
+
+def stem_indonesian(word: str) -> str:
+    """Stemmer ringan berbasis aturan (varian algoritma Tala).
+
+    Tidak sempurna, tetapi cukup untuk menyatukan bentuk seperti
+    "fotosintesisnya", "berfotosintesis" dan "fotosintesis" pada indeks leksikal.
+    """
+    if len(word) <= _MIN_STEM_LENGTH + 1 or word.isdigit():
+        return word
+    word = _strip_suffix(word, _PARTICLES)
+    word = _strip_suffix(word, _POSSESSIVES)
+    word, stripped = _strip_prefix(word, _FIRST_ORDER_PREFIXES)
+    if stripped:
+        word, _ = _strip_prefix(word, _SECOND_ORDER_PREFIXES)
+    else:
+        word, stripped = _strip_prefix(word, _SECOND_ORDER_PREFIXES)
+    return _strip_suffix(word, _SUFFIXES)
+
+
+def tokenize(text: str) -> List[str]:
+    """Memecah teks menjadi token ter-stem tanpa stopword, untuk BM25."""
+    tokens = []
+    for token in _TOKEN_RE.findall(normalize_text(text)):
+        if token in INDONESIAN_STOPWORDS:
+            continue
+        tokens.append(stem_indonesian(token))
+    return tokens
@@ -0,0 +1,71 @@
+"""Compare the native extractors in services/rag.py with unstructured.
+
+For every PDF, PPTX and TXT file in a fixture directory, this runs the
+registered native extractor and unstructured's partition. It reports:
+- time per file for both;
+- text parity: the share of unstructured's word tokens also found by the
+  native extractor (token recall);
+- the Jaccard similarity of the two token sets.
+
+    python backend/benchmarks/bench_extractors.py path/to/fixtures [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from backend.app.services.rag import EXTRACTORS, MIME_PDF, MIME_PPTX, MIME_TXT, extract_unstructured_elements  # noqa: E402
+from backend.app.services.text import normalize_text  # noqa: E402
+
+MIME_BY_EXTENSION = {".pdf": MIME_PDF, ".pptx": MIME_PPTX, ".txt": MIME_TXT}
+
+
+def timed(fn, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, min(timings)
+
+
+def tokens(elements) -> set:
+    return set(normalize_text(" ".join(el["text"] for el in elements)).split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per file; the fastest is reported")
+    args = parser.parse_args()
+
+    rows = []
+    for name in sorted(os.listdir(args.corpus)):
+        mime_type = MIME_BY_EXTENSION.get(os.path.splitext(name)[1].lower())
+        if mime_type is None:
+            continue
+        content = open(os.path.join(args.corpus, name), "rb").read()
+        native, native_ms = timed(lambda: EXTRACTORS[mime_type](content), args.repeat)
+        baseline, baseline_ms = timed(lambda: extract_unstructured_elements(content, mime_type), args.repeat)
+        native_tokens, baseline_tokens = tokens(native), tokens(baseline)
+        recall = len(native_tokens & baseline_tokens) / len(baseline_tokens) if baseline_tokens else 1.0
+        union = native_tokens | baseline_tokens
+        jaccard = len(native_tokens & baseline_tokens) / len(union) if union else 1.0
+        rows.append((name, native_ms, baseline_ms, recall, jaccard))
+
+    print(f"{'file':<40} {'native ms':>10} {'unstr. ms':>10} {'speedup':>8} {'recall':>7} {'jaccard':>8}")
+    for name, native_ms, baseline_ms, recall, jaccard in rows:
+        print(f"{name[:40]:<40} {native_ms:>10.1f} {baseline_ms:>10.1f} {baseline_ms / max(native_ms, 1e-6):>7.1f}x {recall:>7.3f} {jaccard:>8.3f}")
+    if rows:
+        print(
+            f"{'total':<40} {sum(r[1] for r in rows):>10.1f} {sum(r[2] for r in rows):>10.1f} "
+            f"{sum(r[2] for r in rows) / max(sum(r[1] for r in rows), 1e-6):>7.1f}x "
+            f"{statistics.mean(r[3] for r in rows):>7.3f} {statistics.mean(r[4] for r in rows):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
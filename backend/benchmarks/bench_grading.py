@@ -0,0 +1,125 @@
+"""Micro-benchmark of quiz grading: submissions graded per second.
+
+Compares the per-answer grading loop the two submit endpoints used to run
+(a question map built per submission, then str(...).lower().strip() on both
+the student's answer and the stored answer, for every answer) with the compiled AnswerKey
+from services/grading.py, one submission at a time and through grade_many.
+
+No database is needed. The quiz and the submissions are synthetic.
+
+    python backend/benchmarks/bench_grading.py [--questions 40] [--submissions 20000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from backend.app.services.grading import AnswerKey  # noqa: E402
+
+
+def make_quiz(questions: int, essays: int) -> list:
+    rows = []
+    for i in range(questions):
+        question_type = "essay" if i < essays else random.choice(["mcq", "true_false"])
+        options = None
+        if question_type == "mcq":
+            options = [f"Option {letter} for question {i}" for letter in "ABCD"]
+            answer = random.choice(options)
+        elif question_type == "true_false":
+            answer = random.choice(["True", "False"])
+        else:
+            answer = None
+        rows.append({"id": str(uuid.uuid4()), "type": question_type, "options": options, "answer": answer, "max_score": 100})
+    return rows
+
+
+def make_submissions(quiz: list, count: int, free_text: float) -> list:
+    """Most answers are option texts as the quiz taker sends them; --free-text of them are typed variants."""
+    submissions = []
+    for _ in range(count):
+        answers = {}
+        for question in quiz:
+            if question["type"] == "essay":
+                answers[question["id"]] = "An essay answer. " * 20
+                continue
+            answer = random.choice(question["options"] if question["type"] == "mcq" else ["True", "False"])
+            if random.random() < free_text:
+                answer = f" {answer.upper()} "
+            answers[question["id"]] = answer
+        submissions.append(answers)
+    return submissions
+
+
+def legacy_grade(questions: list, user_answers: dict):
+    """The old loop: question map built per submission, both sides normalized per answer."""
+    questions_map = {str(q["id"]): q for q in questions}
+    score = total = 0
+    answers, essays = [], []
+    for question_id, user_answer in user_answers.items():
+        question = questions_map.get(question_id)
+        if not question:
+            continue
+        if question["type"] == "essay":
+            total += question.get("max_score") or 0
+            essays.append({"quiz_question_id": question_id, "student_answer": user_answer})
+        elif question["type"] in ["mcq", "true_false"]:
+            max_score = question.get("max_score")
+            if max_score is None:
+                max_score = 1
+            total += max_score
+            is_correct = str(question.get("answer", "")).strip().lower() == str(user_answer).strip().lower()
+            if is_correct:
+                score += max_score
+            answers.append({"question_id": question_id, "answer": user_answer, "is_correct": is_correct})
+    return score, total, answers, essays
+
+
+def rate(label: str, fn, submissions: int, repeat: int):
+    best = None
+    for _ in range(repeat):
+        # Like timeit: without the cyclic GC, which otherwise dominates with this many retained rows
+        gc.collect()
+        gc.disable()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<22} {submissions / best:>12,.0f} submissions/s")
+    return submissions / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--essays", type=int, default=2)
+    parser.add_argument("--submissions", type=int, default=20000)
+    parser.add_argument("--free-text", type=float, default=0.05, help="Share of answers that differ from the option text")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant; the fastest is reported")
+    args = parser.parse_args()
+
+    quiz = make_quiz(args.questions, args.essays)
+    submissions = make_submissions(quiz, args.submissions, args.free_text)
+    answer_key = AnswerKey.compile(quiz)
+
+    mismatches = sum(
+        legacy_grade(quiz, answers)[:2] != (graded.score, graded.total)
+        for answers, graded in zip(submissions, answer_key.grade_many(submissions))
+    )
+    print(f"{args.submissions:,} submissions of {args.questions} questions ({args.essays} essays), {mismatches} scoring mismatches")
+
+    legacy = rate("legacy loop", lambda: [legacy_grade(quiz, answers) for answers in submissions], args.submissions, args.repeat)
+    single = rate("AnswerKey.grade", lambda: [answer_key.grade(answers) for answers in submissions], args.submissions, args.repeat)
+    rate("AnswerKey.grade_many", lambda: answer_key.grade_many(submissions), args.submissions, args.repeat)
+    started = time.perf_counter()
+    AnswerKey.compile(quiz)
+    print(f"  compile once: {(time.perf_counter() - started) * 1000:.3f} ms   speedup {single / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
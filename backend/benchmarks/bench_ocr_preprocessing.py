@@ -0,0 +1,101 @@
+"""Quality-vs-size benchmark for OCR page preprocessing.
+
+Renders each page of the given PDFs with the old pipeline (pdf2image default
+200 DPI, colour PNG) and with several preprocessing configurations. For each
+configuration it reports render + preprocess + encode time and base64 upload
+bytes per page.
+
+With --ocr, every encoded page is also sent to the ocr-pdf-image Edge Function
+(SUPABASE_URL must be set). Text similarity against the baseline's OCR output
+is reported as a difflib ratio (1.0 = identical).
+
+    python backend/benchmarks/bench_ocr_preprocessing.py scans/*.pdf [--ocr]
+"""
+import argparse
+import base64
+import difflib
+import io
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from pdf2image import convert_from_bytes
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from backend.app.services.ocr_preprocess import OcrImageOptions, encode_page, prepare_page  # noqa: E402
+
+CONFIGS = {
+    "png-200dpi-color": None, # Baseline: the previous pipeline
+    "jpeg-150-gray": OcrImageOptions(dpi=150, color_mode="grayscale", crop_margins=True, image_format="jpeg", quality=80),
+    "webp-150-gray": OcrImageOptions(dpi=150, color_mode="grayscale", crop_margins=True, image_format="webp", quality=75),
+    "png-150-binary": OcrImageOptions(dpi=150, color_mode="binary", crop_margins=True, image_format="png"),
+    "jpeg-110-gray": OcrImageOptions(dpi=110, color_mode="grayscale", crop_margins=True, image_format="jpeg", quality=70),
+}
+
+
+def encode_pages(pdf_bytes: bytes, options):
+    """Returns [(base64 payload, mime_type)] and the elapsed seconds."""
+    started = time.perf_counter()
+    pages = []
+    if options is None:
+        for image in convert_from_bytes(pdf_bytes):
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            pages.append((base64.b64encode(buffer.getvalue()).decode(), "image/png"))
+    else:
+        images = convert_from_bytes(pdf_bytes, dpi=options.dpi, grayscale=options.color_mode != "color")
+        for image in images:
+            data, mime_type = encode_page(prepare_page(image, options), options)
+            pages.append((base64.b64encode(data).decode(), mime_type))
+    return pages, time.perf_counter() - started
+
+
+def ocr(client: httpx.Client, payload: str, mime_type: str) -> str:
+    response = client.post(
+        f"{os.environ['SUPABASE_URL']}/functions/v1/ocr-pdf-image",
+        json={"image_base64": payload, "mime_type": mime_type},
+    )
+    response.raise_for_status()
+    return response.json().get("extracted_text") or ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--ocr", action="store_true", help="Also OCR every page and compare text with the baseline")
+    args = parser.parse_args()
+
+    documents = [open(path, "rb").read() for path in args.pdfs]
+    baseline_texts = {}
+    print(f"{'config':<18} {'pages':>5} {'ms/page':>9} {'KB/page':>9} {'size':>7} {'similarity':>10}")
+    with httpx.Client(timeout=120.0) as client:
+        baseline_kb = None
+        for name, options in CONFIGS.items():
+            page_ms, page_kb, similarities = [], [], []
+            for doc_index, pdf_bytes in enumerate(documents):
+                pages, elapsed = encode_pages(pdf_bytes, options)
+                page_ms.append(elapsed * 1000 / max(1, len(pages)))
+                page_kb.extend(len(payload) / 1024 for payload, _ in pages)
+                if args.ocr:
+                    for page_index, (payload, mime_type) in enumerate(pages):
+                        text = ocr(client, payload, mime_type)
+                        key = (doc_index, page_index)
+                        if options is None:
+                            baseline_texts[key] = text
+                        elif key in baseline_texts:
+                            similarities.append(difflib.SequenceMatcher(None, baseline_texts[key], text).ratio())
+
+            avg_kb = statistics.mean(page_kb) if page_kb else 0.0
+            baseline_kb = baseline_kb or avg_kb
+            similarity = f"{statistics.mean(similarities):.3f}" if similarities else ("1.000" if args.ocr and options is None else "-")
+            print(
+                f"{name:<18} {len(page_kb):>5} {statistics.mean(page_ms):>9.1f} {avg_kb:>9.1f} "
+                f"{avg_kb / baseline_kb if baseline_kb else 0:>6.2f}x {similarity:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
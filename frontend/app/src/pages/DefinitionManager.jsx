@@ -7,20 +7,36 @@ function DefinitionManager() {
   const [definitions, setDefinitions] = useState([]);
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
+  const [search, setSearch] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  const fetchDefinitions = async () => {
+  // Definitions are paginated by term; pass a cursor to append the next page
+  const fetchDefinitions = async (cursor = null) => {
     try {
-      // Note: We need an endpoint to get definitions. Assuming one exists at /definitions
-      const response = await api.get('/definitions');
-      setDefinitions(response.data || []);
+      const params = { limit: 50 };
+      if (search.trim()) params.q = search.trim();
+      if (cursor) params.cursor = cursor;
+      const response = await api.get('/definitions/definitions', { params });
+      const items = response.data?.items || [];
+      setDefinitions((prev) => (cursor ? [...prev, ...items] : items));
+      setNextCursor(response.data?.next_cursor || null);
     } catch (err) {
       setError('Failed to load definitions.');
     }
   };
 
   useEffect(() => {
-    fetchDefinitions();
-  }, []);
+    // Debounce search input
+    const timeout = setTimeout(() => fetchDefinitions(), 300);
+    return () => clearTimeout(timeout);
+  }, [search]);
+
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    await fetchDefinitions(nextCursor);
+    setLoadingMore(false);
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -31,7 +47,7 @@ function DefinitionManager() {
     setLoading(true);
     setError('');
     try {
-      await api.post('/definitions', { term, definition });
+      await api.post('/definitions/definitions', { term, definition });
       setTerm('');
       setDefinition('');
       fetchDefinitions(); // Refresh the list
@@ -86,6 +102,13 @@ function DefinitionManager() {
 
       <div className="mt-8">
         <h2 className="text-xl font-semibold mb-4">Existing Definitions</h2>
+        <input
+          type="text"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          className="mb-4 block w-full px-3 py-2 bg-white border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-indigo-500 focus:border-indigo-500 sm:text-sm"
+          placeholder="Search terms..."
+        />
         <div className="bg-white shadow overflow-hidden sm:rounded-md">
           <ul className="divide-y divide-gray-200">
             {definitions.length > 0 ? (
@@ -100,6 +123,15 @@ function DefinitionManager() {
             )}
           </ul>
         </div>
+        {nextCursor && (
+          <button
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="mt-4 inline-flex justify-center py-2 px-4 border border-gray-300 shadow-sm text-sm font-medium rounded-md text-gray-700 bg-white hover:bg-gray-50 disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
@@ -35,9 +35,49 @@ function chunkText(
   return textSplitter.splitText(text);
 }
 
+// Relay Gemini's streaming generation as Server-Sent Events.
+// If the caller disconnects, cancel() stops pulling further chunks from Gemini.
+function streamGeneration(prompt: string): Response {
+  const encoder = new TextEncoder();
+  let cancelled = false;
+
+  const body = new ReadableStream({
+    async start(controller) {
+      try {
+        const result = await chatModel.generateContentStream(prompt);
+        for await (const chunk of result.stream) {
+          if (cancelled) break;
+          const token = chunk.text();
+          if (token) {
+            controller.enqueue(encoder.encode(`data: ${JSON.stringify({ token })}\n\n`));
+          }
+        }
+        if (!cancelled) {
+          controller.enqueue(encoder.encode(`event: done\ndata: {}\n\n`));
+        }
+      } catch (error) {
+        console.error("Error while streaming from Gemini:", error);
+        if (!cancelled) {
+          controller.enqueue(encoder.encode(`event: error\ndata: ${JSON.stringify({ error: error.message })}\n\n`));
+        }
+      } finally {
+        if (!cancelled) controller.close();
+      }
+    },
+    cancel() {
+      cancelled = true;
+    },
+  });
+
+  return new Response(body, {
+    headers: { "Content-Type": "text/event-stream", "Cache-Control": "no-cache" },
+    status: 200,
+  });
+}
+
 serve(async (req) => {
   try {
-    const { class_id, question } = await req.json();
+    const { class_id, question, context_chunks, stream } = await req.json();
 
     if (!class_id || !question) {
       return new Response(
@@ -59,49 +99,56 @@ serve(async (req) => {
       }
     );
 
-    // 1. Generate embedding for the user's question
-    const queryEmbedding = await generateQueryEmbedding(question);
-
-    // 2. Retrieve relevant material chunks from Supabase (class-specific)
-    const { data: classMaterialsData, error: classMaterialsError } =
-      await supabaseClient
-        .from("class_materials")
-        .select("material_id")
-        .eq("class_id", class_id);
-
-    if (classMaterialsError) throw classMaterialsError;
-
     // Initialize an array to hold all relevant context
     let allContextChunks: string[] = [];
 
-    if (classMaterialsData && classMaterialsData.length > 0) {
-      const materialIds = classMaterialsData.map(
-        (m: { material_id: string }) => m.material_id
-      );
+    // The Python backend performs hybrid (BM25 + vector) retrieval and sends the
+    // resulting context. Only fall back to vector retrieval here when it is absent.
+    if (Array.isArray(context_chunks)) {
+      allContextChunks = context_chunks;
+    } else {
+      // 1. Generate embedding for the user's question
+      const queryEmbedding = await generateQueryEmbedding(question);
+
+      // 2. Retrieve relevant material chunks from Supabase (class-specific)
+      const { data: classMaterialsData, error: classMaterialsError } =
+        await supabaseClient
+          .from("class_materials")
+          .select("material_id")
+          .eq("class_id", class_id);
+
+      if (classMaterialsError) throw classMaterialsError;
+
+      if (classMaterialsData && classMaterialsData.length > 0) {
+        const materialIds = classMaterialsData.map(
+          (m: { material_id: string }) => m.material_id
+        );
+
+        const { data: relevantMaterialChunks, error: materialChunksError } = await supabaseClient.rpc('search_material_embeddings', {
+            query_embedding: queryEmbedding,
+            material_ids: materialIds
+        });
+
+        if (materialChunksError) throw materialChunksError;
+        if (relevantMaterialChunks) {
+          allContextChunks = allContextChunks.concat(relevantMaterialChunks.map((r: { text: string }) => r.text));
+        }
+      }
 
-      const { data: relevantMaterialChunks, error: materialChunksError } = await supabaseClient.rpc('search_material_embeddings', {
+      // 3. Retrieve relevant general definitions (if any)
+      const { data: relevantDefinitions, error: definitionsError } = await supabaseClient.rpc('search_general_definitions', {
           query_embedding: queryEmbedding,
-          material_ids: materialIds
+          filter_class_id: class_id
       });
 
-      if (materialChunksError) throw materialChunksError;
-      if (relevantMaterialChunks) {
-        allContextChunks = allContextChunks.concat(relevantMaterialChunks.map((r: { text: string }) => r.text));
+      if (definitionsError) throw definitionsError;
+      if (relevantDefinitions) {
+        relevantDefinitions.forEach((def: { term: string, definition: string }) => {
+          allContextChunks.push(`Definisi Umum: ${def.term} - ${def.definition}`);
+        });
       }
     }
 
-    // 3. Retrieve relevant general definitions (if any)
-    const { data: relevantDefinitions, error: definitionsError } = await supabaseClient.rpc('search_general_definitions', {
-        query_embedding: queryEmbedding
-    });
-
-    if (definitionsError) throw definitionsError;
-    if (relevantDefinitions) {
-      relevantDefinitions.forEach((def: { term: string, definition: string }) => {
-        allContextChunks.push(`Definisi Umum: ${def.term} - ${def.definition}`);
-      });
-    }
-
     // If no context found from either source, return appropriate message
     if (allContextChunks.length === 0) {
       return new Response(
@@ -133,7 +180,11 @@ ${question}
 Jawaban Anda:
 `;
 
-    // 4. Call Gemini API
+    // 4. Call Gemini API, streaming tokens as Server-Sent Events when requested
+    if (stream) {
+      return streamGeneration(prompt);
+    }
+
     const result = await chatModel.generateContent(prompt);
     const responseText = result.response.text();
 
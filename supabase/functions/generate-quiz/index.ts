@@ -23,7 +23,7 @@ serve(async (req) => {
   }
 
   try {
-    const { material_id, question_type, num_questions } = await req.json();
+    const { material_id, question_type, num_questions, difficulty } = await req.json();
     if (!material_id) throw new Error("material_id is required");
 
     // 1. Get Supabase material data
@@ -50,6 +50,7 @@ serve(async (req) => {
     const model = genAI.getGenerativeModel({ model: "gemini-2.5-flash" });
     const prompt = `
       Based on the following material (in Bahasa Indonesia), create a quiz with ${num_questions || 5} questions of type "${question_type || 'mcq'}".
+      The difficulty level of the questions must be "${difficulty || 'medium'}" (one of "easy", "medium", "hard").
       All questions and answers must be in Bahasa Indonesia.
       
       The output must be a valid JSON object with a single key "questions", containing an array of question objects. Do not include any text outside the JSON object.
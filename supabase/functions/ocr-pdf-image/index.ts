@@ -4,6 +4,9 @@ import { createClient } from "https://esm.sh/@supabase/supabase-js@2.38.5";
 // Ensure you have your Google Gemini API key set as a Supabase secret
 // SUPABASE_SECRETS = { "GEMINI_API_KEY": "YOUR_GEMINI_API_KEY" }
 
+// The backend preprocesses pages (grayscale, cropped) and usually sends JPEG or WebP
+const SUPPORTED_MIME_TYPES = ["image/png", "image/jpeg", "image/webp"];
+
 serve(async (req) => {
   if (req.method !== "POST") {
     return new Response(JSON.stringify({ error: "Method Not Allowed" }), {
@@ -13,7 +16,7 @@ serve(async (req) => {
   }
 
   try {
-    const { image_base64 } = await req.json();
+    const { image_base64, mime_type = "image/png" } = await req.json();
 
     if (!image_base64) {
       return new Response(
@@ -25,6 +28,16 @@ serve(async (req) => {
       );
     }
 
+    if (!SUPPORTED_MIME_TYPES.includes(mime_type)) {
+      return new Response(
+        JSON.stringify({ error: `Unsupported mime_type ${mime_type}` }),
+        {
+          status: 400,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    }
+
     const geminiApiKey = Deno.env.get("GEMINI_API_KEY");
     if (!geminiApiKey) {
       return new Response(
@@ -52,7 +65,7 @@ serve(async (req) => {
                 { text: "Extract all text from this image:" },
                 {
                   inline_data: {
-                    mime_type: "image/png", // Assuming PNG, adjust if needed
+                    mime_type: mime_type,
                     data: image_base64,
                   },
                 },
@@ -0,0 +1,45 @@
+-- Paginated definitions catalogue for the Definition Manager.
+--
+-- list_general_definitions returns only display columns (never the embedding), ordered by
+-- (term, id) with keyset pagination: pass the term and id of the last row of the previous page.
+-- search matches a term prefix (case-insensitive) or a similar term (pg_trgm).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS general_definitions_term_id_idx
+    ON public.general_definitions (term, id);
+CREATE INDEX IF NOT EXISTS general_definitions_term_trgm_idx
+    ON public.general_definitions USING gin (term gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION public.list_general_definitions(
+    filter_class_id uuid DEFAULT NULL,
+    include_global boolean DEFAULT true,
+    search text DEFAULT NULL,
+    after_term text DEFAULT NULL,
+    after_id uuid DEFAULT NULL,
+    page_size int DEFAULT 50
+)
+RETURNS TABLE (
+    id uuid,
+    term text,
+    definition text,
+    class_id uuid,
+    created_at timestamptz
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT gd.id, gd.term, gd.definition, gd.class_id, gd.created_at::timestamptz
+    FROM public.general_definitions gd
+    WHERE
+        -- No class: the whole catalogue. A class: its definitions, plus global ones if requested.
+        (filter_class_id IS NULL
+            OR gd.class_id = filter_class_id
+            OR (include_global AND gd.class_id IS NULL))
+        AND (search IS NULL
+            OR gd.term ILIKE replace(replace(replace(search, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+            OR gd.term % search)
+        AND (after_term IS NULL OR (gd.term, gd.id) > (after_term, after_id))
+    ORDER BY gd.term, gd.id
+    LIMIT page_size;
+$$;
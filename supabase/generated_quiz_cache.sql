@@ -0,0 +1,24 @@
+-- Content version of a material's processed text (sha256 of the extracted text),
+-- set by the RAG pipeline after embedding. Generated quizzes are cached per version.
+ALTER TABLE public.materials
+ADD COLUMN IF NOT EXISTS content_version TEXT;
+
+-- Durable cache of AI-generated quiz questions, shared by every teacher generating
+-- from the same material with the same options.
+CREATE TABLE IF NOT EXISTS public.generated_quiz_cache (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    material_id UUID NOT NULL REFERENCES public.materials(id) ON DELETE CASCADE,
+    content_version TEXT NOT NULL,
+    quiz_type TEXT NOT NULL,
+    num_questions INTEGER NOT NULL,
+    difficulty TEXT NOT NULL,
+    quiz_data JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Lookups always take the most recent variant for a key
+CREATE INDEX IF NOT EXISTS idx_generated_quiz_cache_key
+ON public.generated_quiz_cache (material_id, content_version, quiz_type, num_questions, difficulty, created_at DESC);
+
+-- Only the backend (service role) reads and writes this table
+ALTER TABLE public.generated_quiz_cache ENABLE ROW LEVEL SECURITY;
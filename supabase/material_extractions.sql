@@ -0,0 +1,20 @@
+-- Cache of extracted material text, keyed by the sha256 of the uploaded file.
+-- Re-chunking, re-embedding or quiz generation reuse it instead of re-running
+-- unstructured partitioning and OCR. Large text/jsonb values are compressed by
+-- Postgres (TOAST) automatically.
+CREATE TABLE IF NOT EXISTS public.material_extractions (
+    content_hash TEXT NOT NULL,
+    extractor_version INTEGER NOT NULL,
+    mime_type TEXT,
+    text TEXT NOT NULL,
+    elements JSONB NOT NULL DEFAULT '[]'::jsonb, -- [{type, text, page}]
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (content_hash, extractor_version)
+);
+
+-- Hash of the stored file, linking a material to its extraction
+ALTER TABLE public.materials
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Only the backend (service role) reads and writes this table
+ALTER TABLE public.material_extractions ENABLE ROW LEVEL SECURITY;
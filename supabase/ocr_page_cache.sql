@@ -0,0 +1,16 @@
+-- Durable OCR result cache for rendered PDF pages, keyed by a hash of the page image.
+-- Pages that repeat across uploads (cover pages, worksheet templates) are OCR'd once.
+CREATE TABLE IF NOT EXISTS public.ocr_page_cache (
+    page_hash TEXT PRIMARY KEY,
+    extracted_text TEXT NOT NULL, -- Empty for blank pages, so they are not sent again either
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Eviction removes entries not used for a while
+CREATE INDEX IF NOT EXISTS idx_ocr_page_cache_last_used_at
+ON public.ocr_page_cache (last_used_at);
+
+-- Only the backend (service role) reads and writes this table
+ALTER TABLE public.ocr_page_cache ENABLE ROW LEVEL SECURITY;
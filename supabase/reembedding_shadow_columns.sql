@@ -0,0 +1,153 @@
+-- Infrastructure for re-embedding material_embeddings and general_definitions with a new
+-- embedding model (see backend/app/services/reembedding.py).
+--
+-- New embeddings are written to a shadow column (embedding_next) while search keeps using
+-- embedding. switch_to_next_embeddings() swaps the columns of both tables in one transaction.
+-- Each migration starts with clear_next_embeddings(), which re-creates embedding_next with the
+-- output size of the target model, so the dimension can change from one model to the next.
+-- The 768 below only applies until the first migration starts.
+
+ALTER TABLE public.material_embeddings ADD COLUMN IF NOT EXISTS embedding_next vector(768);
+ALTER TABLE public.general_definitions ADD COLUMN IF NOT EXISTS embedding_next vector(768);
+
+-- Checkpoint per table so an interrupted run resumes after the last processed id
+CREATE TABLE IF NOT EXISTS public.reembedding_checkpoints (
+    table_name text PRIMARY KEY,
+    model text NOT NULL,
+    last_id uuid,
+    processed bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.reembedding_checkpoints ENABLE ROW LEVEL SECURITY;
+-- Only the service role (backend) touches checkpoints; no policies for other roles.
+
+-- Writes one batch of shadow embeddings in a single round trip.
+-- rows: [{"id": "...", "embedding": [..]}, ...]
+CREATE OR REPLACE FUNCTION public.set_next_embeddings(target_table text, rows jsonb)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated int;
+BEGIN
+    IF target_table NOT IN ('material_embeddings', 'general_definitions') THEN
+        RAISE EXCEPTION 'Unsupported table %', target_table;
+    END IF;
+    EXECUTE format(
+        'UPDATE public.%I t SET embedding_next = r.embedding::text::vector
+         FROM jsonb_to_recordset($1) AS r(id uuid, embedding jsonb)
+         WHERE t.id = r.id',
+        target_table
+    ) USING rows;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END;
+$$;
+
+-- Starts a migration on one table: embedding_next is dropped and re-added as vector(dimension),
+-- discarding vectors of a previous target model. general_definitions also gets its HNSW index
+-- on the new column here, once per migration, so it is already indexed when the switch promotes it.
+-- Altering the tables needs their owner's rights, hence SECURITY DEFINER.
+DROP FUNCTION IF EXISTS public.clear_next_embeddings(text);
+CREATE OR REPLACE FUNCTION public.clear_next_embeddings(target_table text, dimension int)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF target_table NOT IN ('material_embeddings', 'general_definitions') THEN
+        RAISE EXCEPTION 'Unsupported table %', target_table;
+    END IF;
+    IF dimension IS NULL OR dimension < 1 THEN
+        RAISE EXCEPTION 'Invalid embedding dimension %', dimension;
+    END IF;
+    EXECUTE format('ALTER TABLE public.%I DROP COLUMN IF EXISTS embedding_next', target_table);
+    EXECUTE format('ALTER TABLE public.%I ADD COLUMN embedding_next vector(%s)', target_table, dimension);
+    IF target_table = 'general_definitions' THEN
+        CREATE INDEX general_definitions_embedding_next_hnsw_idx
+            ON public.general_definitions USING hnsw (embedding_next vector_cosine_ops);
+    END IF;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS public.search_material_embeddings(vector(768), uuid[], int);
+CREATE OR REPLACE FUNCTION public.search_material_embeddings(
+    query_embedding vector,
+    material_ids uuid[],
+    match_count int DEFAULT 5
+)
+RETURNS TABLE (
+    material_id uuid,
+    chunk_index int,
+    text text,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        me.material_id,
+        me.chunk_index,
+        me.text,
+        (me.embedding <-> query_embedding) AS similarity
+    FROM
+        public.material_embeddings me
+    WHERE
+        me.material_id = ANY(material_ids)
+    ORDER BY
+        similarity ASC
+    LIMIT match_count;
+END;
+$$;
+
+-- Promotes embedding_next to embedding for both tables at once. The search functions read
+-- the embedding column, so they switch to the new model when this transaction commits.
+-- The previous embeddings stay in embedding_previous (without an index) until the next switch.
+-- The new embedding_next keeps the same dimension; the next migration resizes and indexes it.
+CREATE OR REPLACE FUNCTION public.switch_to_next_embeddings()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    next_dimension text;
+BEGIN
+    LOCK TABLE public.material_embeddings, public.general_definitions IN ACCESS EXCLUSIVE MODE;
+
+    IF EXISTS (SELECT 1 FROM public.material_embeddings WHERE embedding_next IS NULL)
+        OR EXISTS (SELECT 1 FROM public.general_definitions WHERE embedding_next IS NULL) THEN
+        RAISE EXCEPTION 'Re-embedding is not complete: some rows have no embedding_next';
+    END IF;
+
+    SELECT format_type(atttypid, atttypmod) INTO next_dimension
+    FROM pg_attribute
+    WHERE attrelid = 'public.material_embeddings'::regclass AND attname = 'embedding_next';
+
+    ALTER TABLE public.material_embeddings DROP COLUMN IF EXISTS embedding_previous;
+    ALTER TABLE public.material_embeddings RENAME COLUMN embedding TO embedding_previous;
+    ALTER TABLE public.material_embeddings RENAME COLUMN embedding_next TO embedding;
+    EXECUTE format('ALTER TABLE public.material_embeddings ADD COLUMN embedding_next %s', next_dimension);
+
+    -- The index built by clear_next_embeddings() follows its column and becomes the search index
+    ALTER TABLE public.general_definitions DROP COLUMN IF EXISTS embedding_previous;
+    DROP INDEX IF EXISTS public.general_definitions_embedding_hnsw_idx;
+    ALTER TABLE public.general_definitions RENAME COLUMN embedding TO embedding_previous;
+    ALTER TABLE public.general_definitions RENAME COLUMN embedding_next TO embedding;
+    ALTER INDEX IF EXISTS public.general_definitions_embedding_next_hnsw_idx RENAME TO general_definitions_embedding_hnsw_idx;
+    EXECUTE format('ALTER TABLE public.general_definitions ADD COLUMN embedding_next %s', next_dimension);
+
+    DELETE FROM public.reembedding_checkpoints;
+END;
+$$;
+
+-- Only the backend (service role) runs migrations
+REVOKE EXECUTE ON FUNCTION public.set_next_embeddings(text, jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.set_next_embeddings(text, jsonb) TO service_role;
+REVOKE EXECUTE ON FUNCTION public.clear_next_embeddings(text, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.clear_next_embeddings(text, int) TO service_role;
+REVOKE EXECUTE ON FUNCTION public.switch_to_next_embeddings() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.switch_to_next_embeddings() TO service_role;
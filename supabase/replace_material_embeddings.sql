@@ -0,0 +1,24 @@
+-- Replaces all chunks of a material in one transaction (POST /materials/{id}/reprocess).
+-- The old chunks stay searchable until the new ones are committed, and a failed
+-- re-embedding leaves them untouched instead of removing the material from chat.
+-- rows: [{"chunk_index": 0, "text": "...", "embedding": [..]}, ...]
+CREATE OR REPLACE FUNCTION public.replace_material_embeddings(p_material_id uuid, p_rows jsonb)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted int;
+BEGIN
+    DELETE FROM public.material_embeddings WHERE material_id = p_material_id;
+
+    INSERT INTO public.material_embeddings (material_id, chunk_index, text, embedding)
+    SELECT p_material_id, r.chunk_index, r.text, r.embedding::text::vector
+    FROM jsonb_to_recordset(p_rows) AS r(chunk_index int, text text, embedding jsonb);
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Only the backend (service role) rewrites chunks
+REVOKE EXECUTE ON FUNCTION public.replace_material_embeddings(uuid, jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.replace_material_embeddings(uuid, jsonb) TO service_role;
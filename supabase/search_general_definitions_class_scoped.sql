@@ -0,0 +1,54 @@
+-- Indexed, class-scoped definition search.
+--
+-- search_general_definitions used to sort every row by distance with a global LIMIT 5 and
+-- ignored class_id. It now filters to the given class plus global definitions (class_id IS NULL),
+-- walks an HNSW index (cosine distance) and takes k and a minimum similarity.
+-- similarity is now 1 - cosine distance (higher is more similar).
+
+CREATE INDEX IF NOT EXISTS general_definitions_embedding_hnsw_idx
+    ON public.general_definitions USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS general_definitions_class_id_idx
+    ON public.general_definitions (class_id);
+
+DROP FUNCTION IF EXISTS public.search_general_definitions(vector);
+DROP FUNCTION IF EXISTS public.search_general_definitions(vector(768));
+CREATE OR REPLACE FUNCTION public.search_general_definitions(
+    query_embedding vector,
+    filter_class_id uuid DEFAULT NULL,
+    match_count int DEFAULT 5,
+    match_threshold float DEFAULT 0
+)
+RETURNS TABLE (
+    term text,
+    definition text,
+    class_id uuid,
+    similarity float
+)
+LANGUAGE plpgsql
+-- The class filter is applied to the candidates the HNSW scan returns, and the scan returns
+-- at most ef_search of them. The inner query over-fetches candidates and ef_search is raised
+-- to cover them, so definitions of other classes rarely crowd out the ones of this class.
+SET hnsw.ef_search = 400
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT c.term, c.definition, c.class_id, c.similarity
+    FROM (
+        SELECT
+            gd.term,
+            gd.definition,
+            gd.class_id,
+            1 - (gd.embedding <=> query_embedding) AS similarity
+        FROM
+            public.general_definitions gd
+        WHERE
+            gd.class_id IS NULL OR gd.class_id = filter_class_id
+        ORDER BY
+            gd.embedding <=> query_embedding
+        LIMIT GREATEST(match_count * 20, 200)
+    ) c
+    WHERE c.similarity >= match_threshold
+    ORDER BY c.similarity DESC
+    LIMIT match_count;
+END;
+$$;
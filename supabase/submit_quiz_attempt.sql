@@ -0,0 +1,71 @@
+-- Persists a graded quiz submission in one transaction (POST /quizzes/{id}/submit).
+-- Replaces the separate result lookup, quiz_answers insert, essay_submissions
+-- insert and results update calls with one rpc. Grading happens in the backend
+-- with the compiled answer key (services/grading.py), shared with POST /results/submit.
+--
+-- Idempotent on p_result_id: the result row is locked, and a retry of an
+-- already submitted attempt returns the stored outcome instead of writing again.
+DROP FUNCTION IF EXISTS public.submit_quiz_attempt(UUID, UUID, UUID, JSONB);
+
+CREATE OR REPLACE FUNCTION public.submit_quiz_attempt(
+    p_result_id UUID,
+    p_quiz_id UUID,
+    p_user_id UUID,
+    p_score INTEGER,
+    p_total INTEGER,
+    p_status TEXT,
+    p_answers JSONB, -- [{question_id, answer, is_correct}] for MCQ/true-false
+    p_essays JSONB -- [{question_id, answer}]
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_result public.results%ROWTYPE;
+BEGIN
+    SELECT * INTO v_result
+    FROM public.results
+    WHERE id = p_result_id AND quiz_id = p_quiz_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Quiz attempt not found or does not belong to user.' USING ERRCODE = 'P0002';
+    END IF;
+
+    IF v_result.ended_at IS NOT NULL THEN
+        IF v_result.status = 'cancelled' THEN
+            RAISE EXCEPTION 'Quiz attempt has been cancelled.' USING ERRCODE = 'P0001';
+        END IF;
+        -- Client retry of a submission that already went through
+        RETURN jsonb_build_object(
+            'score', v_result.score,
+            'total', v_result.total,
+            'status', v_result.status,
+            'already_submitted', TRUE
+        );
+    END IF;
+
+    INSERT INTO public.quiz_answers (result_id, question_id, user_id, answer, is_correct, attempt_number)
+    SELECT p_result_id, a.question_id, p_user_id, a.answer, a.is_correct, v_result.attempt_number
+    FROM jsonb_to_recordset(p_answers) AS a(question_id UUID, answer TEXT, is_correct BOOLEAN);
+
+    INSERT INTO public.essay_submissions (quiz_result_id, quiz_question_id, student_answer)
+    SELECT p_result_id, e.question_id, COALESCE(e.answer, '')
+    FROM jsonb_to_recordset(p_essays) AS e(question_id UUID, answer TEXT);
+
+    UPDATE public.results
+    SET score = p_score, total = p_total, ended_at = NOW(), status = p_status
+    WHERE id = p_result_id;
+
+    RETURN jsonb_build_object(
+        'score', p_score,
+        'total', p_total,
+        'status', p_status,
+        'already_submitted', FALSE
+    );
+END;
+$$;
+
+-- Takes the user id as a parameter, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.submit_quiz_attempt(UUID, UUID, UUID, INTEGER, INTEGER, TEXT, JSONB, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.submit_quiz_attempt(UUID, UUID, UUID, INTEGER, INTEGER, TEXT, JSONB, JSONB) TO service_role;
@@ -0,0 +1,33 @@
+-- Return chunk identity (material_id, chunk_index) from vector search so the
+-- backend can fuse vector hits with its BM25 lexical index (reciprocal rank fusion).
+DROP FUNCTION IF EXISTS public.search_material_embeddings(vector(768), uuid[]);
+DROP FUNCTION IF EXISTS public.search_material_embeddings(vector(768), uuid[], int);
+CREATE OR REPLACE FUNCTION public.search_material_embeddings(
+    query_embedding vector(768),
+    material_ids uuid[],
+    match_count int DEFAULT 5
+)
+RETURNS TABLE (
+    material_id uuid,
+    chunk_index int,
+    text text,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        me.material_id,
+        me.chunk_index,
+        me.text,
+        (me.embedding <-> query_embedding) AS similarity
+    FROM
+        public.material_embeddings me
+    WHERE
+        me.material_id = ANY(material_ids)
+    ORDER BY
+        similarity ASC
+    LIMIT match_count;
+END;
+$$;